@@ -1,9 +1,15 @@
 from enum import Enum
+import functools
 import time
+from urllib.parse import urlsplit
 import requests
+from rate_limiter import DEFAULT_APP_LIMITS, RateLimiter
+from response_cache import IMMUTABLE_ENDPOINTS
 
 
 MINUTE = 60
+# most match ids match-v5 returns per page
+MATCHHISTORY_PAGE = 100
 
 ERROR_CODES = {
     400: "Bad Request: There is a syntax error in the request.",
@@ -81,7 +87,7 @@ class RiotApiInterface:
     """Get data from riot api. Methods implemented only for nececcary endpoints."""
 
     def __init__(
-        self, api_key, platform, default_rate_limit=False
+        self, api_key, platform, default_rate_limit=False, cache=None, rate_limiter=None
     ):
         self.api_key = api_key
         self.platform = platform
@@ -89,36 +95,38 @@ class RiotApiInterface:
         self.base_lol_url = f"https://{platform}.api.riotgames.com/lol/"
         self.base_lol_region_url = f"https://{self.region}.api.riotgames.com/lol/"
         self.headers = {"X-Riot-Token": api_key}
-
-        self.last_call_on_endpoints = {}
-        self.default_rate_limit = default_rate_limit
-
-    def rate_limiter(request_per_second):
-        def decorator(func):
-            def wrapper(self, *args, **kwargs):
-                if not self.default_rate_limit:
-                    last_call_time = self.last_call_on_endpoints.get(func.__name__, 0)
-                    delta_seconds = time.time() - last_call_time
-                    wait_time = 1 / request_per_second - delta_seconds
-                    if wait_time > 0:
-                        time.sleep(wait_time)
-                else:
-                    # use default rate limit 100 request per 2 minute
-                    default_request_per_second = 100 / (2 * MINUTE + 1)
-                    last_call_time = self.last_call_on_endpoints.get("default", 0)
-                    delta_seconds = time.time() - last_call_time
-                    wait_time = 1 / default_request_per_second - delta_seconds
-                    if wait_time > 0:
-                        time.sleep(wait_time)
-
-                result = func(self, *args, **kwargs)
-                self.last_call_on_endpoints[func.__name__] = time.time()
-                self.last_call_on_endpoints["default"] = time.time()
-                return result
-
-            return wrapper
-
-        return decorator
+        # keep-alive connections to the platform and region hosts
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+
+        # limits are learned from the response headers, a development key starts from its known ones.
+        # Instances of one key share a RateLimiter, the application limit is per host and not per instance
+        if rate_limiter is None:
+            rate_limiter = RateLimiter(DEFAULT_APP_LIMITS if default_rate_limit else None)
+        self.limiter = rate_limiter
+        # optional ResponseCache, looked up before the rate limiter waits
+        self.cache = cache
+
+    def cached(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            if self.cache is None:
+                return func(self, *args, **kwargs)
+            if func.__name__ in IMMUTABLE_ENDPOINTS:
+                # (endpoint, matchId), shared with collector-2
+                key = str(args[0])
+            else:
+                # endTime is pinned to the time of the first page of a match history,
+                # within its TTL a cached page answers for any endTime
+                params = sorted((k, v) for k, v in kwargs.items() if k != "endTime")
+                key = f"{self.api_key}:{self.platform}:{args}:{params}"
+            data = self.cache.get(func.__name__, key)
+            if data is None:
+                data = func(self, *args, **kwargs)
+                self.cache.put(func.__name__, key, data)
+            return data
+
+        return wrapper
 
     def handle_response(self, response):
         if response.status_code == 200:
@@ -128,43 +136,48 @@ class RiotApiInterface:
             error_description = ERROR_CODES.get(error_code, "Unknown Error")
             raise Exception(f"Error {error_code}: {error_description}")
 
-    @rate_limiter(request_per_second=500 / 10 * MINUTE)
+    def _get(self, url, method):
+        # waits for every window of the host and the method, then syncs them with the response headers
+        host = urlsplit(url).netloc
+        self.limiter.acquire(self.api_key, host, method)
+        response = self.session.get(url)
+        self.limiter.update(self.api_key, host, method, response.headers)
+        return response
+
+    @cached
     def get_challenger_leagues(self, queue):
         url = f"{self.base_lol_url}league/v4/challengerleagues/by-queue/{queue}"
-        response = requests.get(url, headers=self.headers)
+        response = self._get(url, "get_challenger_leagues")
         return self.handle_response(response)
 
-    @rate_limiter(request_per_second=500 / 10 * MINUTE)
+    @cached
     def get_grandmaster_leagues(self, queue):
         url = f"{self.base_lol_url}league/v4/grandmasterleagues/by-queue/{queue}"
-        response = requests.get(url, headers=self.headers)
+        response = self._get(url, "get_grandmaster_leagues")
         return self.handle_response(response)
 
-    @rate_limiter(request_per_second=500 / 10 * MINUTE)
+    @cached
     def get_master_leagues(self, queue):
         url = f"{self.base_lol_url}league/v4/masterleagues/by-queue/{queue}"
-        response = requests.get(url, headers=self.headers)
+        response = self._get(url, "get_master_leagues")
         return self.handle_response(response)
 
-    @rate_limiter(request_per_second=500 / (2 * MINUTE))
     def get_league_entries(self, queue, division, tier):
         url = f"{self.base_lol_url}league/v4/entries/{queue}/{tier}/{division}"
-        response = requests.get(url, headers=self.headers)
+        response = self._get(url, "get_league_entries")
         return self.handle_response(response)
 
-    @rate_limiter(request_per_second=500 / (2 * MINUTE))
     def get_league_by_id(self, league_id):
         url = f"{self.base_lol_url}league/v4/leagues/{league_id}"
-        response = requests.get(url, headers=self.headers)
+        response = self._get(url, "get_league_by_id")
         return self.handle_response(response)
 
-    @rate_limiter(request_per_second=1600 / 1 * MINUTE)
     def get_summoner_by_encrypted_summoner_id(self, encrypted_summoner_id):
         url = f"{self.base_lol_url}summoner/v4/summoners/{encrypted_summoner_id}"
-        response = requests.get(url, headers=self.headers)
+        response = self._get(url, "get_summoner_by_encrypted_summoner_id")
         return self.handle_response(response)
 
-    @rate_limiter(request_per_second=2_000 / 10)
+    @cached
     def get_matchhistory_by_puuid(
         self,
         encrypted_puuid,
@@ -188,17 +201,45 @@ class RiotApiInterface:
         parameters.append(f"start={start}")
         parameters.append(f"count={count}")
         url += "&".join(parameters)
-        response = requests.get(url, headers=self.headers)
+        response = self._get(url, "get_matchhistory_by_puuid")
         return self.handle_response(response)
 
-    @rate_limiter(request_per_second=2_000 / 10)
+    def get_full_matchhistory_by_puuid(self, encrypted_puuid, startTime=None, endTime=None, stop_at=None, **kwargs):
+        """Every match id of the puuid between startTime and endTime, newest first.
+
+        Pages of MATCHHISTORY_PAGE ids are asked until one comes back short.
+        endTime is pinned to now, so games played while paging do not shift
+        the offsets. Paging stops after a page with an id in `stop_at`, e.g.
+        the stored matches of an incremental crawl: older ones are known too.
+        """
+        if endTime is None:
+            endTime = int(time.time())
+        match_ids = []
+        start = 0
+        while True:
+            page = self.get_matchhistory_by_puuid(
+                encrypted_puuid,
+                start=start,
+                count=MATCHHISTORY_PAGE,
+                startTime=startTime,
+                endTime=endTime,
+                **kwargs,
+            )
+            match_ids.extend(page)
+            if len(page) < MATCHHISTORY_PAGE:
+                return match_ids
+            if stop_at is not None and any(m in stop_at for m in page):
+                return match_ids
+            start += MATCHHISTORY_PAGE
+
+    @cached
     def get_match_by_id(self, match_id):
         url = f"{self.base_lol_region_url}match/v5/matches/{match_id}"
-        response = requests.get(url, headers=self.headers)
+        response = self._get(url, "get_match_by_id")
         return self.handle_response(response)
 
-    @rate_limiter(request_per_second=2_000 / 10)
+    @cached
     def get_match_timeline_by_id(self, match_id):
         url = f"{self.base_lol_region_url}match/v5/matches/{match_id}/timeline"
-        response = requests.get(url, headers=self.headers)
+        response = self._get(url, "get_match_timeline_by_id")
         return self.handle_response(response)
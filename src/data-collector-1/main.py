@@ -10,9 +10,17 @@ import json
 import sqlite3
 from typing import List
 import RiotApiInterface
+from rate_limiter import RateLimiter
+from response_cache import SHORT_TTLS, ResponseCache
+from puuid_store import PuuidStore
+from db_writer import BatchedSqliteWriter
+from match_types import MATCH_TYPES
 import pandas as pd
 import tqdm
 
+# shared by every thread, they all use the key of riot.txt
+rate_limiter = RateLimiter()
+
 def fetch_high_tier_puuids():
     platforms = list(
         filter(
@@ -89,34 +97,35 @@ def convert_date_to_string(year, month, day):
 
     
 def write_match_data_by_match_id(database_path, _queue: queue.Queue, threads):
-    db = sqlite3.connect(database_path)
+    # many matches per transaction, WAL journal
+    writer = BatchedSqliteWriter(database_path, types=MATCH_TYPES)
     i = 0
     while True:
         try:
-            game_data, game_participants, game_timeline = _queue.get(block=False, timeout=None)
-            game_data.to_json("game_data.json")
-            game_participants.to_json("game_participants.json")
-            break
-            
-            game_data.to_sql(con=db, name="game_data", if_exists='append', index=False)
-            game_participants.to_sql(con=db, name="game_participants", if_exists='append', index=False)
-            # game_timeline.to_sql(con=db, name="game_timeline", if_exists='append', index=False)
+            # wait at most until the open batch is due
+            timeout = writer.time_left()
+            game_data, game_participants, game_timeline = _queue.get(timeout=0.1 if timeout is None else timeout)
+            writer.add_match({"game_data": game_data, "game_participants": game_participants})
+            # writer.add_match({"game_timeline": game_timeline})
             i += 1
             if i % 1000 == 0:
                 print(f"Written {i} rows")
         except queue.Empty as e:
-            time.sleep(0.1)
-            if not any([t.is_alive() for t in threads]):
+            if not any([t.is_alive() for t in threads]) and _queue.empty():
                 break
         except Exception as e:
             print("Error at db writer thread:", e)
-    db.close()
+        if writer.due():
+            writer.commit()
+    writer.close()
     print("End of writer thread")
 
 def produce_match_data_by_match_id(platforms: List[str], _queue: queue.Queue):
     API = open("./riot.txt", "r").readline()
+    # match documents never change, reruns read them from the cache
+    cache = ResponseCache("./data/response_cache.db", ttls=SHORT_TTLS)
     for platform in platforms:
-        rai = RiotApiInterface.RiotApiInterface(API, platform, default_rate_limit=True)
+        rai = RiotApiInterface.RiotApiInterface(API, platform, default_rate_limit=True, cache=cache, rate_limiter=rate_limiter)
         f = "./data/match_ids/machids_{}.txt".format(platform)
         if not os.path.exists(f):
             print("{} does not exist".format(f))
@@ -132,6 +141,8 @@ def produce_match_data_by_match_id(platforms: List[str], _queue: queue.Queue):
                 game_participants = pd.json_normalize(match, record_path=["info", "participants"], max_level=0, sep='.')
                 game_participants.drop(["challenges", "missions", "perks"], axis=1, inplace=True)
                 game_participants["gameId"] = match["info"]["gameId"]
+                # gameIds repeat across platforms
+                game_participants["platformId"] = match["info"]["platformId"]
                 # timestamp events
                 #match_timeline["info"]["frames"] = [event for frame in match_timeline["info"]["frames"] for event in frame["events"]]
                 #match_timeline["info"]["frames"] = [event for event in match_timeline["info"]["frames"] if "ITEM" in event["type"]]
@@ -154,12 +165,14 @@ def produce_match_data_by_match_id(platforms: List[str], _queue: queue.Queue):
                 _queue.put((game_data, game_participants, None))
             except Exception as e:
                 print(f"Error getting match data at {platform}: {str(e)}")
+    # buffered entries are written on close
+    cache.close()
 
 def get_matchids_by_puuid(platforms: List[str], startTime):
     # https://leagueoflegends.fandom.com/wiki/Patch_(League_of_Legends)
     API = open("./riot.txt", "r").readline()
     for platform in platforms:
-        rai = RiotApiInterface.RiotApiInterface(API, platform, default_rate_limit=True)
+        rai = RiotApiInterface.RiotApiInterface(API, platform, default_rate_limit=True, rate_limiter=rate_limiter)
         f = "./data/puuids/puuids_{}.txt".format(platform)
         if not os.path.exists(f):
             print("{} does not exists".format(f))
@@ -168,7 +181,7 @@ def get_matchids_by_puuid(platforms: List[str], startTime):
         matchlist = set()
         for puuid in tqdm.tqdm(puuids, desc="Getting matchids from {}".format(platform)):    
             try:
-                match_history = rai.get_matchhistory_by_puuid(puuid, start=0, count=100, startTime=startTime)
+                match_history = rai.get_full_matchhistory_by_puuid(puuid, startTime=startTime)
                 matchlist.update(match_history)
             except Exception as e:
                 print(f"Error getting matchlist at {platform}: {str(e)}")
@@ -180,7 +193,7 @@ def get_matchids_by_puuid(platforms: List[str], startTime):
 def get_hightier_puuids(platform):
     API = open("./riot.txt", "r").readline()
 
-    rai = RiotApiInterface.RiotApiInterface(API, platform, default_rate_limit=True)
+    rai = RiotApiInterface.RiotApiInterface(API, platform, default_rate_limit=True, rate_limiter=rate_limiter)
 
     leagues = rai.get_challenger_leagues(RiotApiInterface.Queue.RANKED_SOLO)
 
@@ -196,17 +209,25 @@ def get_hightier_puuids(platform):
         leagues = rai.get_master_leagues(queue)
         summonerIds.update([entry["summonerId"] for entry in leagues["entries"]])
     print("Number of summonerIds:", len(summonerIds))
-    # Get puuids of each summonerId
+    # Get puuids of each summonerId, known ones from the store of earlier runs
+    store = PuuidStore("./data/puuids.db")
 
     puuids = set()
     for summonerId in tqdm.tqdm(
         summonerIds, desc="Getting puuids from {}".format(platform)
     ):
+        puuid = store.get(summonerId)
+        if puuid is not None:
+            puuids.add(puuid)
+            continue
         try:
             summoner = rai.get_summoner_by_encrypted_summoner_id(summonerId)
+            store.put(summonerId, platform, summoner["puuid"])
             puuids.add(summoner["puuid"])
         except Exception as e:
             print(f"Error getting puuid for summonerId {summonerId}: {str(e)}")
+    print(f"{store.hits} puuids known, {store.misses} looked up")
+    store.close()
 
     # save list of puuids to file
     with open("./data/puuids/puuids_{}.txt".format(platform), "w") as f:
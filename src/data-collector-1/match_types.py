@@ -0,0 +1,177 @@
+"""Declared column types of game_data and game_participants.
+
+The fields of match-v5 as documented by Riot, so a column does not take
+the type of whatever its first match held (e.g. a null or an int in a
+column that is later a float). Fields missing here, e.g. ones added to
+match-v5 later, still get the type of their first non null value.
+"""
+
+
+GAME_DATA_TEXT = [
+    "metadata.dataVersion",
+    "metadata.matchId",
+    "info.endOfGameResult",
+    "info.gameMode",
+    "info.gameName",
+    "info.gameType",
+    "info.gameVersion",
+    "info.platformId",
+    "info.tournamentCode",
+]
+GAME_DATA_INTEGER = [
+    "info.gameCreation",
+    "info.gameDuration",
+    "info.gameEndTimestamp",
+    "info.gameId",
+    "info.gameStartTimestamp",
+    "info.mapId",
+    "info.queueId",
+]
+
+PARTICIPANT_TEXT = [
+    "platformId",
+    "championName",
+    "individualPosition",
+    "lane",
+    "puuid",
+    "riotIdGameName",
+    "riotIdTagline",
+    "role",
+    "summonerId",
+    "summonerName",
+    "teamPosition",
+]
+PARTICIPANT_BOOLEAN = [
+    "eligibleForProgression",
+    "firstBloodAssist",
+    "firstBloodKill",
+    "firstTowerAssist",
+    "firstTowerKill",
+    "gameEndedInEarlySurrender",
+    "gameEndedInSurrender",
+    "teamEarlySurrendered",
+    "win",
+]
+PARTICIPANT_INTEGER = [
+    "gameId",
+    "participantId",
+    "teamId",
+    "championId",
+    "championTransform",
+    "champExperience",
+    "champLevel",
+    "profileIcon",
+    "summonerLevel",
+    "summoner1Id",
+    "summoner2Id",
+    "summoner1Casts",
+    "summoner2Casts",
+    "spell1Casts",
+    "spell2Casts",
+    "spell3Casts",
+    "spell4Casts",
+    "kills",
+    "deaths",
+    "assists",
+    "doubleKills",
+    "tripleKills",
+    "quadraKills",
+    "pentaKills",
+    "unrealKills",
+    "killingSprees",
+    "largestKillingSpree",
+    "largestMultiKill",
+    "largestCriticalStrike",
+    "bountyLevel",
+    "goldEarned",
+    "goldSpent",
+    "item0",
+    "item1",
+    "item2",
+    "item3",
+    "item4",
+    "item5",
+    "item6",
+    "itemsPurchased",
+    "consumablesPurchased",
+    "totalMinionsKilled",
+    "neutralMinionsKilled",
+    "totalAllyJungleMinionsKilled",
+    "totalEnemyJungleMinionsKilled",
+    "baronKills",
+    "dragonKills",
+    "turretKills",
+    "turretTakedowns",
+    "turretsLost",
+    "inhibitorKills",
+    "inhibitorTakedowns",
+    "inhibitorsLost",
+    "nexusKills",
+    "nexusTakedowns",
+    "nexusLost",
+    "objectivesStolen",
+    "objectivesStolenAssists",
+    "damageDealtToBuildings",
+    "damageDealtToObjectives",
+    "damageDealtToTurrets",
+    "damageSelfMitigated",
+    "magicDamageDealt",
+    "magicDamageDealtToChampions",
+    "magicDamageTaken",
+    "physicalDamageDealt",
+    "physicalDamageDealtToChampions",
+    "physicalDamageTaken",
+    "trueDamageDealt",
+    "trueDamageDealtToChampions",
+    "trueDamageTaken",
+    "totalDamageDealt",
+    "totalDamageDealtToChampions",
+    "totalDamageShieldedOnTeammates",
+    "totalDamageTaken",
+    "totalHeal",
+    "totalHealsOnTeammates",
+    "totalUnitsHealed",
+    "totalTimeCCDealt",
+    "timeCCingOthers",
+    "totalTimeSpentDead",
+    "longestTimeSpentLiving",
+    "timePlayed",
+    "visionScore",
+    "wardsPlaced",
+    "wardsKilled",
+    "detectorWardsPlaced",
+    "sightWardsBoughtInGame",
+    "visionWardsBoughtInGame",
+    "allInPings",
+    "assistMePings",
+    "basicPings",
+    "commandPings",
+    "dangerPings",
+    "enemyMissingPings",
+    "enemyVisionPings",
+    "getBackPings",
+    "holdPings",
+    "needVisionPings",
+    "onMyWayPings",
+    "pushPings",
+    "retreatPings",
+    "visionClearedPings",
+    "placement",
+    "subteamPlacement",
+    "playerSubteamId",
+    "playerAugment1",
+    "playerAugment2",
+    "playerAugment3",
+    "playerAugment4",
+]
+
+
+def _types(**columns):
+    # {"INTEGER": [column]} -> {column: "INTEGER"}
+    return {column: sql_type for sql_type, names in columns.items() for column in names}
+
+
+MATCH_TYPES = {
+    "game_data": _types(TEXT=GAME_DATA_TEXT, INTEGER=GAME_DATA_INTEGER),
+    "game_participants": _types(TEXT=PARTICIPANT_TEXT, BOOLEAN=PARTICIPANT_BOOLEAN, INTEGER=PARTICIPANT_INTEGER),
+}
@@ -0,0 +1,155 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+
+# finished games never change, these are kept until evicted
+IMMUTABLE_ENDPOINTS = {"get_match_by_id", "get_match_timeline_by_id"}
+
+# opt-in TTLs in seconds for endpoints whose answer changes over time
+SHORT_TTLS = {
+    "get_challenger_leagues": 600,
+    "get_grandmaster_leagues": 600,
+    "get_master_leagues": 600,
+    "get_matchhistory_by_puuid": 300,
+}
+
+# new entries and last_access updates are written in one transaction once
+# this many are buffered or the oldest is this old
+FLUSH_ROWS = 256
+FLUSH_S = 2.0
+
+
+class ResponseCache:
+    """Persistent cache of decoded api responses, keyed by (endpoint, id).
+
+    Entries live in one sqlite file under the sha1 of their key, as zlib
+    compressed json. Immutable endpoints never expire. Other endpoints are
+    only cached if `ttls` gives them a lifetime. When the stored size goes
+    over `max_bytes` the least recently used entries are evicted.
+
+    The file is shared by several processes, so it is opened in WAL mode
+    and writes are buffered: a hit only records its access time and new
+    entries wait in memory, both are written together by flush(). Buffered
+    writes are lost if the process dies before close().
+    """
+
+    def __init__(self, path="data/response_cache.db", max_bytes=20 * 1024**3, ttls=None, level=6):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttls = dict(ttls or {})
+        self.level = level
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, endpoint TEXT, data BLOB, size INTEGER, "
+            "last_access REAL, expires REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_lru ON responses (last_access)")
+        self._db.commit()
+        self._lock = threading.Lock()
+        self._size = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        # digest -> row not written yet
+        self._pending = {}
+        # digest -> last access not written yet
+        self._touched = {}
+        self._flushed = time.time()
+        self.hits = 0
+        self.misses = 0
+
+    def cacheable(self, endpoint):
+        return endpoint in IMMUTABLE_ENDPOINTS or endpoint in self.ttls
+
+    def _key(self, endpoint, key):
+        return hashlib.sha1(f"{endpoint}:{key}".encode()).hexdigest()
+
+    def get(self, endpoint, key):
+        """Cached data of the call, None on a miss or if the entry expired."""
+        if not self.cacheable(endpoint):
+            return None
+        digest = self._key(endpoint, key)
+        now = time.time()
+        with self._lock:
+            pending = self._pending.get(digest)
+            if pending is not None:
+                row = (pending[2], pending[5])
+            else:
+                row = self._db.execute(
+                    "SELECT data, expires FROM responses WHERE key = ?", (digest,)
+                ).fetchone()
+            if row is None or (row[1] is not None and row[1] < now):
+                self.misses += 1
+                return None
+            self._touched[digest] = now
+            self.hits += 1
+            self._maybe_flush(now)
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, endpoint, key, data):
+        if not self.cacheable(endpoint):
+            return
+        blob = zlib.compress(json.dumps(data).encode(), self.level)
+        now = time.time()
+        ttl = self.ttls.get(endpoint)
+        expires = None if endpoint in IMMUTABLE_ENDPOINTS or ttl is None else now + ttl
+        digest = self._key(endpoint, key)
+        with self._lock:
+            pending = self._pending.get(digest)
+            if pending is not None:
+                old = pending[3]
+            else:
+                old = self._db.execute("SELECT size FROM responses WHERE key = ?", (digest,)).fetchone()
+                old = old[0] if old else 0
+            self._pending[digest] = (digest, endpoint, blob, len(blob), now, expires)
+            self._touched.pop(digest, None)
+            self._size += len(blob) - old
+            self._maybe_flush(now)
+
+    def _maybe_flush(self, now):
+        if len(self._pending) + len(self._touched) >= FLUSH_ROWS or now - self._flushed >= FLUSH_S:
+            self._flush()
+
+    def _flush(self):
+        with self._db:
+            self._db.executemany("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)", self._pending.values())
+            self._db.executemany(
+                "UPDATE responses SET last_access = ? WHERE key = ?",
+                [(t, digest) for digest, t in self._touched.items()],
+            )
+            if self._size > self.max_bytes:
+                self._evict()
+        self._pending.clear()
+        self._touched.clear()
+        self._flushed = time.time()
+
+    def flush(self):
+        """Write the buffered entries and access times."""
+        with self._lock:
+            self._flush()
+
+    def _evict(self):
+        # drop expired entries first, then the least recently used down to 90% of the budget
+        self._db.execute("DELETE FROM responses WHERE expires IS NOT NULL AND expires < ?", (time.time(),))
+        self._size = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        target = self.max_bytes * 0.9
+        rows = self._db.execute("SELECT key, size FROM responses ORDER BY last_access")
+        evict = []
+        for key, size in rows:
+            if self._size <= target:
+                break
+            evict.append((key,))
+            self._size -= size
+        self._db.executemany("DELETE FROM responses WHERE key = ?", evict)
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self._db.close()
@@ -2,9 +2,13 @@ from enum import Enum
 import time
 import requests
 import math
+import ijson
+from urllib.parse import urlsplit
 
 
 MINUTE = 60
+# most match ids match-v5 returns per page
+MATCHHISTORY_PAGE = 100
 
 ERROR_CODES = {
     400: "Bad Request: There is a syntax error in the request.",
@@ -18,6 +22,30 @@ ERROR_CODES = {
 }
 
 
+class RiotApiError(Exception):
+    """Non-200 answer of the api, with what is needed to decide on a retry."""
+
+    def __init__(self, status_code, url, retry_after=None, rate_limit_type=None):
+        self.status_code = status_code
+        self.url = url
+        # seconds from the Retry-After header, None if it was missing
+        self.retry_after = retry_after
+        # "application", "method" or "service" from the X-Rate-Limit-Type header of a 429
+        self.rate_limit_type = rate_limit_type
+        super().__init__(
+            f"Error for {status_code}: {ERROR_CODES.get(status_code, 'Unknown Error')}"
+        )
+
+    @classmethod
+    def from_response(cls, status_code, url, headers):
+        retry_after = headers.get("Retry-After")
+        try:
+            retry_after = float(retry_after) if retry_after is not None else None
+        except ValueError:
+            retry_after = None
+        return cls(status_code, url, retry_after, headers.get("X-Rate-Limit-Type"))
+
+
 class Platform:
     BR1 = "br1"
     EUN1 = "eun1"
@@ -149,7 +177,22 @@ def get_user_agent(api_key):
 
 
 class RiotApiInterface:
-    """Get data from riot api. Methods implemented only for nececcary endpoints."""
+    """Get data from riot api. Methods implemented only for nececcary endpoints.
+
+    If a rate limiter is given, every call waits for a free slot of its
+    (api key, host, method) and reports the rate limit headers back to it.
+    If a session pool is given, calls reuse its keep-alive connections.
+    If a base url is given (e.g. the local mock server), calls go to
+    `{base_url}/{platform or region}/lol/...` instead of the riot hosts.
+    If a response cache is given, cacheable endpoints are looked up in it
+    before a rate limit slot is spent.
+    """
+
+    def __init__(self, rate_limiter=None, session_pool=None, base_url=None, cache=None):
+        self.rate_limiter = rate_limiter
+        self.session_pool = session_pool
+        self.base_url = base_url.rstrip("/") if base_url else None
+        self.cache = cache
 
     def get_header(self, api_key):
         return {
@@ -157,40 +200,68 @@ class RiotApiInterface:
             "User-Agent": get_user_agent(api_key),
         }
 
+    def get_platform_host(self, platform):
+        return f"{platform}.api.riotgames.com"
+
+    def get_region_host(self, region):
+        return f"{region}.api.riotgames.com"
+
     def get_platform_url(self, platform):
-        return f"https://{platform}.api.riotgames.com/lol/"
+        if self.base_url:
+            return f"{self.base_url}/{platform}/lol/"
+        return f"https://{self.get_platform_host(platform)}/lol/"
 
     def get_region_url(self, region):
-        return f"https://{region}.api.riotgames.com/lol/"
+        if self.base_url:
+            return f"{self.base_url}/{region}/lol/"
+        return f"https://{self.get_region_host(region)}/lol/"
+
+    def get_routing_host(self, url):
+        """Riot host the url is counted against by the rate limits."""
+        if self.base_url:
+            # same host name as the real api, so limits stay separate per routing value
+            return self.get_region_host(urlsplit(url).path.split("/")[1])
+        return urlsplit(url).netloc
 
     def handle_response(self, response):
         if response.status_code == 200:
             return response.json()
         else:
             error_code = response.status_code
-            error_description = ERROR_CODES.get(error_code, "Unknown Error")
             print(f"Error {error_code} for URL: {response.url}")
             print(f"Response content: {response.text}")
-            raise Exception(f"Error for {error_code}: {error_description}")
+            raise RiotApiError.from_response(error_code, response.url, response.headers)
+
+    def _http_get(self, url, api_key, **kwargs):
+        if not self.session_pool:
+            return requests.get(url, headers=self.get_header(api_key), **kwargs)
+        session = self.session_pool.get(api_key, urlsplit(url).netloc)
+        return session.get(
+            url,
+            headers=self.get_header(api_key),
+            timeout=self.session_pool.timeout,
+            **kwargs,
+        )
 
-    def _get_resposne(self, url, api_key):
+    def _get_resposne(self, url, api_key, **kwargs):
         #print(f"Requesting {url}, with api key {api_key}")
         if len(API_TO_AGENT_MAP.items()) == 0:
-            return requests.get(url, headers=self.get_header(api_key))
+            return self._http_get(url, api_key, **kwargs)
 
         # handle timeout errors with multiple proxies
         proxies = get_proxies(api_key)
         # just run without proxy if returned none
         if not proxies:
-            return requests.get(url, headers=self.get_header(api_key))
+            return self._http_get(url, api_key, **kwargs)
         
         for proxy in proxies:
             print(f"Using proxy {proxy}")
             try:
-                return requests.get(
+                return self._http_get(
                     url,
-                    headers=self.get_header(api_key),
+                    api_key,
                     proxies={"http": proxy, "https": proxy},
+                    **kwargs,
                 )
             except (requests.RequestException, requests.Timeout) as e:
                 #print(f"Error with proxy {proxy}")
@@ -199,44 +270,62 @@ class RiotApiInterface:
                 #    f"Removed proxy {proxy}, remaining: {len(API_TO_PROXY_MAP[api_key])}"
                 #)
 
+    def _request(self, url, api_key, method, **kwargs):
+        host = self.get_routing_host(url)
+        if self.rate_limiter:
+            self.rate_limiter.acquire(api_key, host, method)
+        response = self._get_resposne(url, api_key, **kwargs)
+        if self.rate_limiter and response is not None:
+            self.rate_limiter.update(api_key, host, method, response.headers)
+        return response
+
+    def _cached_request(self, url, api_key, method, cache_key):
+        if self.cache:
+            data = self.cache.get(method, cache_key)
+            if data is not None:
+                return data
+        data = self.handle_response(self._request(url, api_key, method))
+        if self.cache:
+            self.cache.put(method, cache_key, data)
+        return data
+
     def get_challenger_leagues(self, queue, platform, api_key):
         url = f"{self.get_platform_url(platform)}league/v4/challengerleagues/by-queue/{queue}"
-        response = requests.get(url, headers=self.get_header(api_key))
-        return self.handle_response(response)
+        # summoner ids in the entries are encrypted per api key
+        return self._cached_request(url, api_key, "get_challenger_leagues", f"{api_key}:{platform}:{queue}")
     
     def http_get_challenger_leagues(self, queue, platform, api_key):
         url = f"{self.get_platform_url(platform)}league/v4/challengerleagues/by-queue/{queue}"
         url = url.replace("https://", "http://")
-        response = requests.get(url, headers=self.get_header(api_key))
+        response = self._request(url, api_key, "http_get_challenger_leagues")
         return self.handle_response(response)
 
     def get_grandmaster_leagues(self, queue, platform, api_key):
         url = f"{self.get_platform_url(platform)}league/v4/grandmasterleagues/by-queue/{queue}"
-        response = requests.get(url, headers=self.get_header(api_key))
-        return self.handle_response(response)
+        return self._cached_request(url, api_key, "get_grandmaster_leagues", f"{api_key}:{platform}:{queue}")
 
     def get_master_leagues(self, queue, platform, api_key):
         url = (
             f"{self.get_platform_url(platform)}league/v4/masterleagues/by-queue/{queue}"
         )
-        response = requests.get(url, headers=self.get_header(api_key))
-        return self.handle_response(response)
+        return self._cached_request(url, api_key, "get_master_leagues", f"{api_key}:{platform}:{queue}")
 
-    def get_league_entries(self, platform, queue, division, tier, api_key):
-        url = f"{self.get_platform_url(platform)}league/v4/entries/{queue}/{tier}/{division}"
-        response = requests.get(url, headers=self.get_header(api_key))
+    def get_league_entries(self, platform, queue, division, tier, api_key, page=1):
+        # paginated, an empty page is past the last one
+        url = f"{self.get_platform_url(platform)}league/v4/entries/{queue}/{tier}/{division}?page={page}"
+        response = self._request(url, api_key, "get_league_entries")
         return self.handle_response(response)
 
     def get_league_by_id(self, league_id, platform, api_key):
         url = f"{self.get_platform_url(platform)}league/v4/leagues/{league_id}"
-        response = requests.get(url, headers=self.get_header(api_key))
+        response = self._request(url, api_key, "get_league_by_id")
         return self.handle_response(response)
 
     def get_summoner_by_encrypted_summoner_id(
         self, encrypted_summoner_id, platform, api_key
     ):
         url = f"{self.get_platform_url(platform)}summoner/v4/summoners/{encrypted_summoner_id}"
-        response = self._get_resposne(url, api_key)
+        response = self._request(url, api_key, "get_summoner_by_encrypted_summoner_id")
         return self.handle_response(response)
 
     def get_matchhistory_by_puuid(
@@ -264,15 +353,72 @@ class RiotApiInterface:
         parameters.append(f"start={start}")
         parameters.append(f"count={count}")
         url += "&".join(parameters)
-        response = requests.get(url, headers=self.get_header(api_key))
-        return self.handle_response(response)
+        return self._cached_request(
+            url, api_key, "get_matchhistory_by_puuid", self._matchhistory_cache_key(region, url)
+        )
+
+    def _matchhistory_cache_key(self, region, url):
+        # endTime is pinned to the time of the first page, so it is left out of the key:
+        # within its TTL a cached page answers for any endTime
+        path, query = url.split("/lol/", 1)[1].split("?", 1)
+        query = "&".join(p for p in query.split("&") if not p.startswith("endTime="))
+        return f"{region}:{path}?{query}"
+
+    def get_full_matchhistory_by_puuid(self, region, encrypted_puuid, api_key, startTime=None, endTime=None, stop_at=None, **kwargs):
+        """Every match id of the puuid between startTime and endTime, newest first.
+
+        Pages of MATCHHISTORY_PAGE ids are asked until one comes back short.
+        endTime is pinned to now, so games played while paging do not shift
+        the offsets. Paging stops after a page with an id in `stop_at`, e.g.
+        the stored matches of an incremental crawl: older ones are known too.
+        """
+        if endTime is None:
+            endTime = int(time.time())
+        match_ids = []
+        start = 0
+        while True:
+            page = self.get_matchhistory_by_puuid(
+                region,
+                encrypted_puuid,
+                api_key,
+                start=start,
+                count=MATCHHISTORY_PAGE,
+                startTime=startTime,
+                endTime=endTime,
+                **kwargs,
+            )
+            match_ids.extend(page)
+            if len(page) < MATCHHISTORY_PAGE:
+                return match_ids
+            if stop_at is not None and any(m in stop_at for m in page):
+                return match_ids
+            start += MATCHHISTORY_PAGE
 
     def get_match_by_id(self, region, match_id, api_key):
         url = f"{self.get_region_url(region)}match/v5/matches/{match_id}"
-        response = requests.get(url, headers=self.get_header(api_key))
-        return self.handle_response(response)
+        return self._cached_request(url, api_key, "get_match_by_id", match_id)
 
     def get_match_timeline_by_id(self, region, match_id, api_key):
         url = f"{self.get_region_url(region)}match/v5/matches/{match_id}/timeline"
-        response = requests.get(url, headers=self.get_header(api_key))
-        return self.handle_response(response)
+        return self._cached_request(url, api_key, "get_match_timeline_by_id", match_id)
+
+    def get_match_timeline_events(self, region, match_id, api_key, event_types):
+        """Events of the match timeline whose type is in `event_types`.
+
+        The timeline is several MB, mostly participant frames. It is parsed
+        while it is read and only the kept events are built, so memory does
+        not grow with the size of the timeline. Not cached for the same reason.
+        """
+        url = f"{self.get_region_url(region)}match/v5/matches/{match_id}/timeline"
+        response = self._request(url, api_key, "get_match_timeline_events", stream=True)
+        try:
+            if response.status_code != 200:
+                return self.handle_response(response)
+            response.raw.decode_content = True
+            return [
+                event
+                for event in ijson.items(response.raw, "info.frames.item.events.item", use_float=True)
+                if event["type"] in event_types
+            ]
+        finally:
+            response.close()
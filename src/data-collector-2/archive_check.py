@@ -0,0 +1,69 @@
+"""Round trip synthetic matches through a temporary MatchArchive and report the result.
+
+    python archive_check.py --matches 200
+
+Puts the matches in two commits, the first short of the training samples
+so it is compressed without a dictionary, reads every match back and
+rebuilds game_data from the archive. Exits non zero on a mismatch.
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+
+from db_writer import BatchedSqliteWriter
+from match_archive import MatchArchive, rebuild
+from mock_server import FakeRiotData
+
+
+def check(matches):
+    """Problems found in the round trip, with the archive stats."""
+    data = FakeRiotData(matches_per_region=matches)
+    originals = [json.loads(data.match(data.match_id("europe", n))) for n in range(matches)]
+    root = tempfile.mkdtemp()
+    archive = MatchArchive(os.path.join(root, "archive"), train_samples=matches // 2)
+    for batch in (originals[: matches // 4], originals[matches // 4 :]):
+        for match in batch:
+            archive.put(match)
+        archive.commit()
+    archive.close()
+
+    problems = []
+    archive = MatchArchive(os.path.join(root, "archive"))
+    stats = archive.stats()
+    if stats["matches"] != matches:
+        problems.append(f"{stats['matches']} of {matches} matches archived")
+    if stats["dictionaries"] != 2:
+        problems.append(f"{stats['dictionaries']} dictionaries used, expected 2")
+    for match in originals:
+        if archive.get(match["metadata"]["matchId"]) != match:
+            problems.append(f"{match['metadata']['matchId']} differs after the round trip")
+    db_path = os.path.join(root, "rebuilt.db")
+    rebuild(archive, BatchedSqliteWriter(db_path))
+    archive.close()
+    db = sqlite3.connect(db_path)
+    (rows,) = db.execute("SELECT COUNT(*) FROM game_data").fetchone()
+    db.close()
+    if rows != matches:
+        problems.append(f"{rows} of {matches} matches rebuilt")
+    return problems, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--matches", type=int, default=200)
+    args = parser.parse_args()
+
+    problems, stats = check(args.matches)
+    for problem in problems:
+        print(problem)
+    if problems:
+        sys.exit(1)
+    print(f"Archive check passed: {args.matches} matches, {stats['bytes'] / 1024:.0f} KiB")
+
+
+if __name__ == "__main__":
+    main()
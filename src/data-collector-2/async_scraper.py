@@ -0,0 +1,345 @@
+"""Asyncio version of RiotApiInterface and RiotDataScraper_2024_07.
+
+One event loop drives every region, api key and endpoint of the process.
+Jobs are coroutines instead of threads, the shared RateLimiter decides when
+each of them may call the api. Match data is pushed to the same writer queue
+as the threaded scraper, so the database output is identical.
+"""
+
+import asyncio
+import queue
+import time
+from typing import List
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from RiotApiInterface import *
+from rate_limiter import RateLimiter
+from match_index import MatchIdSet
+from retry import RetryPolicy, is_app_rate_limited
+from seeding import ENTRY_TIERS, SEED_QUEUES, SEED_TIERS, SeedOwners
+
+
+class AsyncRiotApiInterface(RiotApiInterface):
+    """Coroutine versions of the endpoints used by the scraper, sharing one aiohttp session."""
+
+    def __init__(self, session: aiohttp.ClientSession, rate_limiter=None, base_url=None, cache=None):
+        super().__init__(rate_limiter, base_url=base_url, cache=cache)
+        self.session = session
+
+    async def handle_response(self, response):
+        if response.status == 200:
+            return await response.json()
+        else:
+            error_code = response.status
+            print(f"Error {error_code} for URL: {response.url}")
+            print(f"Response content: {await response.text()}")
+            raise RiotApiError.from_response(error_code, str(response.url), response.headers)
+
+    async def _request(self, url, api_key, method, cache_key=None):
+        # sqlite reads, decompression and flushes of the cache run in the default executor, not on the loop
+        if self.cache and cache_key is not None:
+            data = await asyncio.to_thread(self.cache.get, method, cache_key)
+            if data is not None:
+                return data
+        data = await self._fetch(url, api_key, method)
+        if self.cache and cache_key is not None:
+            await asyncio.to_thread(self.cache.put, method, cache_key, data)
+        return data
+
+    async def _fetch(self, url, api_key, method):
+        host = self.get_routing_host(url)
+        if self.rate_limiter:
+            while True:
+                wait = self.rate_limiter.reserve(api_key, host, method)
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+        async with self.session.get(url, headers=self.get_header(api_key)) as response:
+            if self.rate_limiter:
+                self.rate_limiter.update(api_key, host, method, response.headers)
+            return await self.handle_response(response)
+
+    async def get_challenger_leagues(self, queue, platform, api_key):
+        url = f"{self.get_platform_url(platform)}league/v4/challengerleagues/by-queue/{queue}"
+        return await self._request(url, api_key, "get_challenger_leagues", f"{api_key}:{platform}:{queue}")
+
+    async def get_grandmaster_leagues(self, queue, platform, api_key):
+        url = f"{self.get_platform_url(platform)}league/v4/grandmasterleagues/by-queue/{queue}"
+        return await self._request(url, api_key, "get_grandmaster_leagues", f"{api_key}:{platform}:{queue}")
+
+    async def get_master_leagues(self, queue, platform, api_key):
+        url = f"{self.get_platform_url(platform)}league/v4/masterleagues/by-queue/{queue}"
+        return await self._request(url, api_key, "get_master_leagues", f"{api_key}:{platform}:{queue}")
+
+    async def get_league_entries(self, platform, queue, division, tier, api_key, page=1):
+        # paginated, an empty page is past the last one
+        url = f"{self.get_platform_url(platform)}league/v4/entries/{queue}/{tier}/{division}?page={page}"
+        return await self._request(url, api_key, "get_league_entries")
+
+    async def get_summoner_by_encrypted_summoner_id(
+        self, encrypted_summoner_id, platform, api_key
+    ):
+        url = f"{self.get_platform_url(platform)}summoner/v4/summoners/{encrypted_summoner_id}"
+        return await self._request(url, api_key, "get_summoner_by_encrypted_summoner_id")
+
+    async def get_matchhistory_by_puuid(
+        self,
+        region,
+        encrypted_puuid,
+        api_key,
+        start=0,
+        count=20,
+        queue=None,
+        type=None,
+        endTime=None,
+        startTime=None,
+    ):
+        parameters = []
+        url = f"{self.get_region_url(region)}match/v5/matches/by-puuid/{encrypted_puuid}/ids?"
+        if queue:
+            parameters.append(f"queue={queue}")
+        if type:
+            parameters.append(f"type={type}")
+        if endTime:
+            parameters.append(f"endTime={endTime}")
+        if startTime:
+            parameters.append(f"startTime={startTime}")
+        parameters.append(f"start={start}")
+        parameters.append(f"count={count}")
+        url += "&".join(parameters)
+        return await self._request(
+            url, api_key, "get_matchhistory_by_puuid", self._matchhistory_cache_key(region, url)
+        )
+
+    async def get_full_matchhistory_by_puuid(self, region, encrypted_puuid, api_key, startTime=None, endTime=None, stop_at=None, **kwargs):
+        if endTime is None:
+            endTime = int(time.time())
+        match_ids = []
+        start = 0
+        while True:
+            page = await self.get_matchhistory_by_puuid(
+                region,
+                encrypted_puuid,
+                api_key,
+                start=start,
+                count=MATCHHISTORY_PAGE,
+                startTime=startTime,
+                endTime=endTime,
+                **kwargs,
+            )
+            match_ids.extend(page)
+            if len(page) < MATCHHISTORY_PAGE:
+                return match_ids
+            if stop_at is not None and any(m in stop_at for m in page):
+                return match_ids
+            start += MATCHHISTORY_PAGE
+
+    async def get_match_by_id(self, region, match_id, api_key):
+        url = f"{self.get_region_url(region)}match/v5/matches/{match_id}"
+        return await self._request(url, api_key, "get_match_by_id", match_id)
+
+    async def get_match_timeline_by_id(self, region, match_id, api_key):
+        url = f"{self.get_region_url(region)}match/v5/matches/{match_id}/timeline"
+        return await self._request(url, api_key, "get_match_timeline_by_id", match_id)
+
+
+class AsyncRiotDataScraper_2024_07:
+    """Same crawl as RiotDataScraper_2024_07 with coroutines.
+
+    Every api key runs `concurrency` summoner and match consumers. They only
+    wait on the rate limiter, so idle capacity of a key is used as soon as it
+    becomes available. Seed players are queued for the key that read their
+    league page, summonerIds are encrypted per key; match ids go to one queue
+    the match consumers of every key take from.
+    """
+
+    def __init__(self, api_keys: List[str], region, rai: AsyncRiotApiInterface, concurrency=20, stop=None, puuids=None, seed_tiers=SEED_TIERS, entry_tiers=ENTRY_TIERS):
+        self.api_keys = api_keys
+        # threading.Event, once set the consumers are cancelled
+        self.stop = stop
+        # PuuidStore, known seeds skip the summoner lookup
+        self.puuids = puuids
+        # leagues the seed players are read from
+        self.seed_tiers = seed_tiers
+        self.entry_tiers = entry_tiers
+        self.rai = rai
+        self.region = region
+        self.region_platforms = REGION_TO_PLATFORMS[region]
+        self.concurrency = concurrency
+        self.retry_policy = RetryPolicy()
+
+        self.process_data = {}
+        self.unique_matchids = MatchIdSet()
+        self.report_time = time.time()
+
+    async def _seed_pages(self, platform, q, owners):
+        """(api key, entries) of every league page of one (platform, queue), as they arrive."""
+        # apex leagues are one call each, the tiers below are paginated
+        leagues = {
+            "CHALLENGER": self.rai.get_challenger_leagues,
+            "GRANDMASTER": self.rai.get_grandmaster_leagues,
+            "MASTER": self.rai.get_master_leagues,
+        }
+        for tier in self.seed_tiers:
+            api_key = owners.next(platform)
+            league = await self._with_retry(api_key, lambda: leagues[tier](q, platform, api_key))
+            yield api_key, league["entries"]
+        for tier, division in self.entry_tiers:
+            page = 1
+            while True:
+                api_key = owners.next(platform)
+                entries = await self._with_retry(
+                    api_key, lambda: self.rai.get_league_entries(platform, q, division, tier, api_key, page=page)
+                )
+                if not entries:
+                    break
+                yield api_key, entries
+                page += 1
+
+    async def _fetch_seeds(self, platform, q, owners, summIds, seen):
+        """Queue the players of one (platform, queue) for the key that read their page."""
+        try:
+            async for api_key, entries in self._seed_pages(platform, q, owners):
+                for entry in entries:
+                    summid = entry["summonerId"]
+                    if summid in seen:
+                        continue
+                    seen.add(summid)
+                    summIds[api_key].put_nowait((platform, summid))
+                    self.process_data["sumIdLen"] = self.process_data.get("sumIdLen", 0) + 1
+        except Exception as e:
+            print(f"{self.region} | Seeding {platform} {q} stopped: {e}")
+
+    async def start(self, db_writer_queue, start_date):
+        # seed players stream in from one task per (platform, queue), the summoner
+        # consumers start with the first page; same page split per key as the threaded scraper
+        owners = SeedOwners(self.api_keys, self.region_platforms)
+        summIds = {api: asyncio.Queue() for api in self.api_keys}
+        seen = set()
+        seeders = [
+            asyncio.create_task(self._fetch_seeds(platform, q, owners, summIds, seen))
+            for platform in self.region_platforms
+            for q in SEED_QUEUES
+        ]
+        matchIds = asyncio.Queue()
+
+        summ_workers = [
+            asyncio.create_task(self.worker_summid_to_matchids_unified(api, summIds[api], matchIds, start_date))
+            for api in self.api_keys
+            for _ in range(self.concurrency)
+        ]
+        match_workers = [
+            asyncio.create_task(self.worker_matchid_to_matchdata(api, matchIds, db_writer_queue))
+            for api in self.api_keys
+            for _ in range(self.concurrency)
+        ]
+
+        async def drained():
+            await asyncio.gather(*seeders)
+            print(f"{self.region} | Seeded {self.process_data.get('sumIdLen', 0)} players")
+            for q in summIds.values():
+                await q.join()
+            await matchIds.join()
+
+        drain = asyncio.create_task(drained())
+        while not drain.done():
+            await asyncio.wait({drain}, timeout=0.5)
+            if self.stop is not None and self.stop.is_set():
+                print(f"{self.region} | Stopping, {matchIds.qsize()} match ids left")
+                drain.cancel()
+                break
+        for t in seeders + summ_workers + match_workers:
+            t.cancel()
+        await asyncio.gather(*seeders, *summ_workers, *match_workers, return_exceptions=True)
+        print(f"{self.region} | All jobs done")
+
+    def _report(self):
+        if time.time() - self.report_time > 10:
+            self.report_time = time.time()
+            puuid_n = self.process_data.get("puuidLen", 0)
+            puuid_total = self.process_data.get("sumIdLen", 0)
+            match_n = self.process_data.get("matchDataLen", 0)
+            match_total = len(self.unique_matchids)
+            print(f"{self.region} | PUUIDs: {puuid_n}/{puuid_total}, Match Data: {match_n}/{match_total}")
+
+    async def _with_retry(self, api_key, make_call):
+        # the consumer keeps its job while waiting, so a retry runs before any new work
+        attempt = 0
+        while True:
+            try:
+                return await make_call()
+            except Exception as e:
+                if is_app_rate_limited(e):
+                    self.rai.rate_limiter.pause(api_key, e.retry_after or 1)
+                delay = self.retry_policy.delay(e, attempt)
+                if delay is None:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    async def worker_summid_to_matchids_unified(self, api_key, summid_queue, matchid_queue, start_date):
+        while True:
+            platform, summid = await summid_queue.get()
+            try:
+                puuid = self.puuids.get(summid) if self.puuids is not None else None
+                if puuid is None:
+                    summoner = await self._with_retry(
+                        api_key, lambda: self.rai.get_summoner_by_encrypted_summoner_id(summid, platform, api_key)
+                    )
+                    puuid = summoner["puuid"]
+                    if self.puuids is not None:
+                        # get is a dict lookup, put writes to sqlite and runs in the default executor
+                        await asyncio.to_thread(self.puuids.put, summid, platform, puuid)
+                matchlist = await self._with_retry(
+                    api_key,
+                    lambda: self.rai.get_full_matchhistory_by_puuid(
+                        self.region, puuid, api_key, startTime=start_date, type="ranked"
+                    ),
+                )
+                for matchid in matchlist:
+                    if matchid not in self.unique_matchids:
+                        self.unique_matchids.add(matchid)
+                        matchid_queue.put_nowait(matchid)
+                self.process_data["puuidLen"] = self.process_data.get("puuidLen", 0) + 1
+            except Exception as e:
+                print(f"Error getting matchids for {summid} on {platform}: {e}")
+            finally:
+                summid_queue.task_done()
+            self._report()
+
+    async def _put(self, matchdata, item):
+        # the writer queue is bounded and blocking, wait for room without blocking the loop
+        while True:
+            try:
+                return matchdata.put_nowait(item)
+            except queue.Full:
+                await asyncio.sleep(0.05)
+
+    async def worker_matchid_to_matchdata(self, api_key, matchid_queue, matchdata):
+        while True:
+            matchId = await matchid_queue.get()
+            try:
+                # backpressure: no new fetches while the writer is behind
+                while matchdata.full():
+                    await asyncio.sleep(0.05)
+                matchData = await self._with_retry(
+                    api_key, lambda: self.rai.get_match_by_id(self.region, matchId, api_key)
+                )
+                await self._put(matchdata, matchData)
+                self.process_data["matchDataLen"] = self.process_data.get("matchDataLen", 0) + 1
+            except Exception as e:
+                print(f"Error getting match {matchId}: {e}")
+            finally:
+                matchid_queue.task_done()
+            self._report()
+
+
+async def scrape_regions(api_keys, regions, db_writer_queue, start_date, pool_size=100, base_url=None, cache=None, stop=None, puuids=None):
+    """Run the scrapers of all regions on the current event loop."""
+    connector = aiohttp.TCPConnector(limit=pool_size, keepalive_timeout=60)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        rai = AsyncRiotApiInterface(session, RateLimiter(), base_url=base_url, cache=cache)
+        scrapers = [AsyncRiotDataScraper_2024_07(api_keys, region, rai, stop=stop, puuids=puuids) for region in regions]
+        await asyncio.gather(*[s.start(db_writer_queue, start_date) for s in scrapers])
@@ -0,0 +1,98 @@
+"""Run RiotDataScraper_2024_07 against the local mock server and report its throughput.
+
+    python benchmark.py --keys 2 --region europe --players 20 --latency 0.05
+
+Reports requests/s per key, how much of each key's application limit was
+used (slot utilization) and matches written to the database per second.
+"""
+
+import argparse
+import math
+import os
+import queue
+import sqlite3
+import tempfile
+import threading
+import time
+
+from mock_server import EmulatedLimits, FakeRiotData, start_mock_server
+from main import RiotDataScraper_2024_07, convert_date_to_string, worker_write_data_to_db
+
+
+def capacity(limits, seconds):
+    """Calls the tightest window allows in `seconds`, counting the burst at the start of each window."""
+    return min(limit * math.ceil(seconds / duration) for limit, duration in limits)
+
+
+def count_rows(db_path):
+    db = sqlite3.connect(db_path)
+    try:
+        return db.execute("SELECT COUNT(*) FROM game_data").fetchone()[0]
+    except sqlite3.OperationalError:
+        return 0
+    finally:
+        db.close()
+
+
+def run(args):
+    limits = EmulatedLimits(args.app_limit, args.method_limit)
+    server = start_mock_server(
+        data=FakeRiotData(players=args.players, matches_per_region=args.matches),
+        limits=limits,
+        latency=args.latency,
+        jitter=args.jitter,
+    )
+    api_keys = [f"RGAPI-benchmark-{i}" for i in range(args.keys)]
+    db_path = os.path.join(tempfile.mkdtemp(), "benchmark.db")
+
+    db_writer_queue = queue.Queue()
+    threading.Thread(
+        target=worker_write_data_to_db, args=(db_path, db_writer_queue), daemon=True
+    ).start()
+
+    scraper = RiotDataScraper_2024_07(
+        api_keys, args.region, workers=args.workers, base_url=server.base_url
+    )
+    # start from the limits the server emulates instead of the development key defaults
+    scraper.rate_limiter.default_app_limits = limits.app_limits
+
+    started = time.time()
+    scraper.start(db_writer_queue, start_date=convert_date_to_string(2024, 7, 1))
+    expected = scraper.process_data.get("matchDataLen", 0)
+    while count_rows(db_path) < expected and time.time() - started < args.timeout:
+        time.sleep(0.2)
+    elapsed = time.time() - started
+    server.shutdown()
+
+    print(f"\n{args.region} | {args.keys} keys, {elapsed:.1f}s, latency {args.latency}s, app limit {args.app_limit}")
+    for api_key in api_keys:
+        served = sum(s[0] for (k, _, _), s in limits.stats.items() if k == api_key)
+        rejected = sum(s[1] for (k, _, _), s in limits.stats.items() if k == api_key)
+        print(f"{api_key}: {served / elapsed:.2f} req/s, {rejected} x 429")
+        routes = sorted({r for (k, r, _) in limits.stats if k == api_key})
+        for route in routes:
+            served = sum(s[0] for (k, r, _), s in limits.stats.items() if k == api_key and r == route)
+            utilization = served / capacity(limits.app_limits, elapsed)
+            print(f"    {route}: {served} calls, slot utilization {utilization:.0%}")
+    rows = count_rows(db_path)
+    print(f"Matches written: {rows}, {rows / elapsed:.2f}/s")
+    print(f"Database: {db_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--keys", type=int, default=2)
+    parser.add_argument("--region", default="europe")
+    parser.add_argument("--workers", type=int, default=4, help="worker threads per key and endpoint")
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--app-limit", default="20:1,100:120")
+    parser.add_argument("--method-limit", default="2000:10")
+    parser.add_argument("--players", type=int, default=10, help="players per tier and queue on each platform")
+    parser.add_argument("--matches", type=int, default=2000, help="distinct matches per region")
+    parser.add_argument("--timeout", type=float, default=60, help="max seconds to wait for the db writer")
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
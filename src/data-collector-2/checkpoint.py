@@ -0,0 +1,121 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class CrawlCheckpoint:
+    """Crawl state of each region in a sqlite file, so a crashed crawl can resume.
+
+    The seed players are stored once. Seen match ids, finished summoners and
+    written matches are buffered in memory and flushed in one transaction at
+    most every `interval` seconds, so a checkpoint costs one small commit.
+    A crash loses at most the last interval, which is fetched again.
+    """
+
+    def __init__(self, path="data/checkpoint.db", interval=30):
+        self.path = path
+        self.interval = interval
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS seeds (region TEXT PRIMARY KEY, players TEXT);
+            CREATE TABLE IF NOT EXISTS state (region TEXT PRIMARY KEY, process_data TEXT);
+            CREATE TABLE IF NOT EXISTS matches (match_id TEXT PRIMARY KEY, region TEXT, done INTEGER DEFAULT 0);
+            CREATE TABLE IF NOT EXISTS summoners (region TEXT, summoner_id TEXT, PRIMARY KEY (region, summoner_id));
+            """
+        )
+        self._db.commit()
+        self._lock = threading.Lock()
+        self._new_matches = []
+        self._done_matches = []
+        self._done_summoners = []
+        self._states = {}
+        self.last_flush = time.time()
+
+    def reset(self, region):
+        """Forget everything about `region`, used when a crawl starts from scratch."""
+        with self._lock:
+            for table in ["seeds", "state", "matches", "summoners"]:
+                self._db.execute(f"DELETE FROM {table} WHERE region = ?", (region,))
+            self._db.commit()
+
+    def save_seed(self, region, top_tier_players):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO seeds VALUES (?, ?)", (region, json.dumps(top_tier_players))
+            )
+            self._db.commit()
+
+    def load(self, region):
+        """Saved state of `region`, None if its seed phase never finished."""
+        with self._lock:
+            row = self._db.execute("SELECT players FROM seeds WHERE region = ?", (region,)).fetchone()
+            if row is None:
+                return None
+            # json turns the player key tuples into lists
+            players = [(tuple(key), summ_ids) for key, summ_ids in json.loads(row[0])]
+            state = self._db.execute("SELECT process_data FROM state WHERE region = ?", (region,)).fetchone()
+            matches = self._db.execute("SELECT match_id, done FROM matches WHERE region = ?", (region,)).fetchall()
+            summoners = self._db.execute("SELECT summoner_id FROM summoners WHERE region = ?", (region,)).fetchall()
+        return {
+            "players": players,
+            "process_data": json.loads(state[0]) if state else {},
+            "seen": set(m for m, _ in matches),
+            "frontier": [m for m, done in matches if not done],
+            "done_summoners": set(s for (s,) in summoners),
+        }
+
+    def add_matches(self, region, match_ids):
+        with self._lock:
+            self._new_matches.extend((m, region) for m in match_ids)
+
+    def summoner_done(self, region, summoner_id):
+        with self._lock:
+            self._done_summoners.append((region, summoner_id))
+
+    def match_done(self, match_id):
+        with self._lock:
+            self._done_matches.append((match_id,))
+
+    def save_state(self, region, process_data):
+        with self._lock:
+            self._states[region] = json.dumps(process_data)
+
+    def maybe_flush(self):
+        if time.time() - self.last_flush >= self.interval:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            if not (self._new_matches or self._done_matches or self._done_summoners or self._states):
+                self.last_flush = time.time()
+                return
+            # match ids before the summoners that found them, in one transaction
+            # the writer may run in another process and mark a match done before the scraper adds it
+            self._db.executemany(
+                "INSERT INTO matches (match_id, region) VALUES (?, ?) "
+                "ON CONFLICT (match_id) DO UPDATE SET region = excluded.region",
+                self._new_matches,
+            )
+            self._db.executemany("INSERT OR IGNORE INTO summoners VALUES (?, ?)", self._done_summoners)
+            self._db.executemany(
+                "INSERT INTO matches (match_id, done) VALUES (?, 1) "
+                "ON CONFLICT (match_id) DO UPDATE SET done = 1",
+                self._done_matches,
+            )
+            self._db.executemany("INSERT OR REPLACE INTO state VALUES (?, ?)", self._states.items())
+            self._db.commit()
+            self._new_matches = []
+            self._done_matches = []
+            self._done_summoners = []
+            self._states = {}
+            self.last_flush = time.time()
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,134 @@
+import sqlite3
+import time
+
+import pandas as pd
+
+from schema_registry import SchemaRegistry
+
+
+def _frame_rows(frame):
+    # python scalars and None instead of numpy values and NaN
+    values = frame.astype(object).where(frame.notna(), None)
+    return tuple(frame.columns), list(values.itertuples(index=False, name=None))
+
+
+class BatchedSqliteWriter:
+    """Append rows to sqlite tables, many matches per transaction.
+
+    Rows are buffered until `batch_size` matches or `batch_ms` milliseconds
+    have been collected, then written with one prepared executemany per
+    table and column set, and committed once. The database runs in WAL mode
+    with synchronous=NORMAL and a larger page cache. Tables and their typed
+    columns come from a SchemaRegistry, fields added by a patch become new
+    columns instead of failing the batch. If a batch fails anyway, its
+    matches are written one by one and only the bad ones are dropped.
+    """
+
+    def __init__(self, db_path, batch_size=500, batch_ms=1000, cache_mb=64, report_every=10, types=None):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.batch_ms = batch_ms
+        self.report_every = report_every
+        self.db = sqlite3.connect(db_path, cached_statements=256)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(f"PRAGMA cache_size={-cache_mb * 1024}")
+        self.db.execute("PRAGMA temp_store=MEMORY")
+        self.schema = SchemaRegistry(self.db, types)
+        # one {table: [(columns, rows)]} per buffered match
+        self._batch = []
+        self._batch_start = None
+        self._rows = 0
+        self._report_start = time.time()
+
+    def add_match(self, tables):
+        """Buffer the rows of one match, given as {table: [(columns, rows)]} or {table: DataFrame}."""
+        if self._batch_start is None:
+            self._batch_start = time.time()
+        self._batch.append(
+            {
+                table: [_frame_rows(data)] if isinstance(data, pd.DataFrame) else data
+                for table, data in tables.items()
+            }
+        )
+
+    def pending(self):
+        return len(self._batch)
+
+    def time_left(self):
+        """Seconds until the current batch is due, None if it is empty."""
+        if self._batch_start is None:
+            return None
+        return max(0.0, self._batch_start + self.batch_ms / 1000 - time.time())
+
+    def due(self):
+        return len(self._batch) >= self.batch_size or (
+            self._batch_start is not None and self.time_left() == 0
+        )
+
+    def _insert(self, table, chunks):
+        # one prepared statement per distinct column set, usually just one
+        by_columns = {}
+        for columns, rows in chunks:
+            by_columns.setdefault(columns, []).extend(rows)
+        count = 0
+        for columns, rows in by_columns.items():
+            statement, positions = self.schema.prepare(table, columns, rows)
+            if statement is None:
+                continue
+            if positions is not None:
+                rows = [tuple(row[i] for i in positions) for row in rows]
+            cursor = self.db.executemany(statement, rows)
+            count += cursor.rowcount
+        return count
+
+    def _write(self, matches):
+        tables = {}
+        for match in matches:
+            for table, chunks in match.items():
+                tables.setdefault(table, []).extend(chunks)
+        rows = 0
+        try:
+            with self.db:
+                # explicit, sqlite3 would run the ALTER TABLEs of new columns outside the transaction
+                self.db.execute("BEGIN")
+                for table, chunks in tables.items():
+                    rows += self._insert(table, chunks)
+        except Exception:
+            # columns added in the rolled back transaction are gone as well
+            self.schema.reload()
+            raise
+        self._rows += rows
+
+    def commit(self):
+        """Write the buffered matches in one transaction. Returns the indexes of the matches written."""
+        batch = self._batch
+        self._batch = []
+        self._batch_start = None
+        if not batch:
+            return []
+        try:
+            self._write(batch)
+            written = list(range(len(batch)))
+        except Exception as e:
+            print(f"DB writer | batch of {len(batch)} failed, writing matches one by one: {e}")
+            written = []
+            for i, match in enumerate(batch):
+                try:
+                    self._write([match])
+                    written.append(i)
+                except Exception as e:
+                    print(f"DB writer | dropping match: {e}")
+        self._report()
+        return written
+
+    def _report(self):
+        elapsed = time.time() - self._report_start
+        if elapsed >= self.report_every:
+            print(f"DB writer | {self._rows / elapsed:.0f} rows/s")
+            self._rows = 0
+            self._report_start = time.time()
+
+    def close(self):
+        self.commit()
+        self.db.close()
@@ -0,0 +1,59 @@
+import threading
+import requests
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+
+
+class SessionPool:
+    """Keep-alive HTTP sessions per (api key, host), shared by all worker threads.
+
+    Each session holds up to `pool_size` open connections to its host, so
+    consecutive calls reuse the TCP+TLS connection instead of a new handshake.
+    """
+
+    def __init__(self, pool_size=10, timeout=10):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def get(self, api_key, host):
+        session = self._sessions.get((api_key, host))
+        if session is not None:
+            return session
+        with self._lock:
+            session = self._sessions.get((api_key, host))
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self._sessions[(api_key, host)] = session
+        return session
+
+    def warmup(self, api_keys, urls, connections=1):
+        """Open `connections` connections per (api key, host of url) before the first real call."""
+
+        def _warm(session, url):
+            try:
+                # any answer is fine, only the handshake matters
+                session.head(url, timeout=self.timeout)
+            except requests.RequestException as e:
+                print(f"Warmup failed for {url}: {e}")
+
+        threads = []
+        for api_key in api_keys:
+            for url in urls:
+                session = self.get(api_key, urlsplit(url).netloc)
+                for _ in range(min(connections, self.pool_size)):
+                    t = threading.Thread(target=_warm, args=(session, url))
+                    t.start()
+                    threads.append(t)
+        for t in threads:
+            t.join()
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
@@ -0,0 +1,71 @@
+import os
+import sqlite3
+
+from match_index import MatchIdSet
+
+
+class KnownMatches:
+    """Matches of a region already in the database, for incremental crawls.
+
+    `match_ids` (a MatchIdSet) seeds the dedup set of the scraper, so stored
+    matches are never queued again. It holds the stored matches of the
+    region and the shared index of written matches, if there is one.
+    `high_water` holds the start of the last stored game of each puuid
+    (epoch seconds), the match history of that puuid is only asked from
+    there on.
+    """
+
+    def __init__(self, match_ids=None, high_water=None):
+        self.match_ids = match_ids if match_ids is not None else MatchIdSet()
+        self.high_water = high_water or {}
+
+    @classmethod
+    def load(cls, db_path, platforms, index_path=None):
+        """Known matches of `platforms`, from the sqlite file at `db_path` (None for other sinks) and the index."""
+        match_ids = MatchIdSet.load(index_path) if index_path else MatchIdSet()
+        if db_path is None or not os.path.isfile(db_path):
+            return cls(match_ids)
+        # match ids and platformId are upper case, e.g. EUW1_7000000000
+        platforms = [p.upper() for p in platforms]
+        marks = ", ".join("?" for _ in platforms)
+        db = None
+        try:
+            db = sqlite3.connect(db_path)
+            match_ids.update(
+                m
+                for (m,) in db.execute(
+                    f'SELECT "metadata.matchId" FROM game_data WHERE "info.platformId" IN ({marks})',
+                    platforms,
+                )
+            )
+            # gameIds repeat across platforms, databases written before participants
+            # had a platformId can only join on the gameId
+            join = 'g."info.gameId" = p.gameId'
+            if any(row[1] == "platformId" for row in db.execute("PRAGMA table_info(game_participants)")):
+                join += ' AND (p.platformId IS NULL OR p.platformId = g."info.platformId")'
+            high_water = dict(
+                db.execute(
+                    f"""
+                    SELECT p.puuid, MAX(g."info.gameStartTimestamp") / 1000
+                    FROM game_participants p JOIN game_data g ON {join}
+                    WHERE g."info.platformId" IN ({marks})
+                    GROUP BY p.puuid
+                    """,
+                    platforms,
+                )
+            )
+        except sqlite3.Error as e:
+            # no tables yet, or not a database
+            print(f"No known matches in {db_path}: {e}")
+            return cls(match_ids)
+        finally:
+            if db is not None:
+                db.close()
+        return cls(match_ids, high_water)
+
+    def start_time(self, puuid, start_date):
+        """startTime for the match history of `puuid`: after its last stored game, never before start_date."""
+        last = self.high_water.get(puuid)
+        if last is None:
+            return start_date
+        return str(max(int(start_date), int(last) + 1))
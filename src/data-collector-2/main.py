@@ -1,3 +1,5 @@
+import asyncio
+import collections
 import queue
 import time
 import os
@@ -7,18 +9,64 @@ import json
 import sqlite3
 from typing import List
 from RiotApiInterface import *
-import pandas as pd
+from rate_limiter import RateLimiter
+from http_pool import SessionPool
+from worker_pool import WorkerPool
+from retry import RetryQueue, is_app_rate_limited
+from scheduler import Scheduler
+from pipeline import PipelinePolicy
+from response_cache import SHORT_TTLS, ResponseCache
+from puuid_store import PuuidStore
+from checkpoint import CrawlCheckpoint
+from incremental import KnownMatches
+from match_index import MatchIdSet
+from snowball import SnowballFrontier
+from seeding import ENTRY_TIERS, SEED_QUEUES, SEED_TIERS, SeedOwners
+from db_writer import BatchedSqliteWriter
+from match_archive import MatchArchive
+from timeline import DEFAULT_EVENT_TYPES, TIMELINE_TYPES, timeline_rows
+from match_flattener import MatchFlattener
+from match_types import MATCH_TYPES
 from tqdm import tqdm
 import multiprocessing
+import signal
 import sys
 
 
+# memory budget of the writer queue, a raw match dict is about 100 KB
+WRITER_QUEUE_MB = 256
+MATCH_KB = 100
+
+# ids of every written match, shared by the regions and runs
+MATCH_INDEX = "data/match_ids.idx"
+# the index is saved when the writer is idle, at most this often
+INDEX_SAVE_S = 60
+
+# set on SIGTERM: scrapers stop dispatching, in-flight jobs finish and the writer drains
+stop_event = threading.Event()
+
+
 def convert_date_to_string(year, month, day):
     return str(int(datetime.datetime(year, month, day).timestamp()))
 
 
-def main():
-    out = "data/data.db"
+def new_writer_queue():
+    # fetch dispatch pauses while it is full
+    return queue.Queue(maxsize=WRITER_QUEUE_MB * 1024 // MATCH_KB)
+
+
+def install_stop_handler(on_stop=None):
+    def handler(signum, frame):
+        print(f"Got signal {signum}, finishing in-flight jobs and draining the writer")
+        stop_event.set()
+        if on_stop:
+            on_stop()
+
+    signal.signal(signal.SIGTERM, handler)
+
+
+def main(resume=False, incremental=False, sink="sqlite", timelines=False, snowball=False):
+    out = "data/parquet" if sink == "parquet" else "data/data.db"
     start_date = convert_date_to_string(2024, 7, 1)
     
     # api
@@ -30,12 +78,13 @@ def main():
     #proxies = list(filter(lambda x: len(x) > 5, proxies))
     #assign_apikeys_to_proxies(proxies, api_keys, leave_first=False)
 
+    install_stop_handler()
+
     # START WRITER
-    terminate = False
-    db_writer_queue = queue.Queue()
+    db_writer_queue = new_writer_queue()
     # start db writer
     db_writer = threading.Thread(
-        target=worker_write_data_to_db, args=(out, db_writer_queue, terminate)
+        target=worker_write_data_to_db, args=(out, db_writer_queue, "data/checkpoint.db", sink, "data/archive", MATCH_INDEX)
     )
     db_writer.start()
 
@@ -43,146 +92,269 @@ def main():
     ts = []
     for region in REGIONS:
         print(f"Starting scraper for {region}")
-        t = threading.Thread(target=start_scraper_for_region, args=(api_keys, region, db_writer_queue, start_date))
+        t = threading.Thread(target=start_scraper_for_region, args=(api_keys, region, db_writer_queue, start_date, resume, incremental, timelines, known_db(out, sink), snowball))
         t.start()
         ts.append(t)
         
     [t.join() for t in ts]
-    while not db_writer_queue.empty():
-        time.sleep(1)
-    terminate = True   
-    
-def main_multiproc():
-    out = "data/data.db"
-    start_date = convert_date_to_string(2024, 7, 1)
-    
-    # api
-    api_keys = open("riot.txt", "r").read().split("\n")
-    api_keys = list(filter(lambda x: len(x) > 5, api_keys))
-
-    # proxies (commented out since they are not used)
-    #proxies = open("proxies.txt", "r").read().split("\n")
-    #proxies = list(filter(lambda x: len(x) > 5, proxies))
-    #assign_apikeys_to_proxies(proxies, api_keys, leave_first=False)
-
-    # START WRITER
-    manager = multiprocessing.Manager()
-    db_writer_queue = manager.Queue()
-    terminate = manager.Value('b', False)
 
-    # start db writer
-    db_writer = multiprocessing.Process(
-        target=worker_write_data_to_db, args=(out, db_writer_queue, terminate)
-    )
-    db_writer.start()
+    print("All regions done, waiting for db writer to finish")
+    db_writer_queue.put(None)
+    db_writer.join()
 
-    # PROCESS FOR EACH REGION
+    
+def main_multiproc(resume=False, incremental=False, sink="sqlite", timelines=False, snowball=False):
+    # PROCESS FOR EACH REGION, each with its own writer and shard
     processes = []
+    # docker stop only signals this process, the regions drain on their own
+    install_stop_handler(lambda: [p.terminate() for p in processes])
     for region in REGIONS:
-        print(f"Starting scraper for {region}")
-        p = multiprocessing.Process(target=start_scraper_for_region, args=(api_keys, region, db_writer_queue, start_date))
+        p = multiprocessing.Process(target=run_region, args=(region, resume, incremental, sink, timelines, snowball))
         p.start()
         processes.append(p)
         
     for p in processes:
         p.join()
-    while not db_writer_queue.empty():
-        time.sleep(1)
-    terminate.value = True
-    db_writer.join() 
-    
-def main_arg():
-    out = "data/data.db"
+    print("All regions done, merge the shards with merge_shards.py")
+
+
+def shard_path(region, sink="sqlite"):
+    if sink == "parquet":
+        # partitioned by region already, every process writes its own files
+        return "data/parquet"
+    return f"data/shards/data_{region}.db"
+
+
+def known_db(out, sink="sqlite"):
+    # incremental crawls read stored matches from sqlite, the parquet sink only has the match index
+    return out if sink == "sqlite" else None
+
+
+def run_region(region, resume=False, incremental=False, sink="sqlite", timelines=False, snowball=False):
+    """Scrape one region into its own shard, so region processes never share a database."""
+    out = shard_path(region, sink)
     start_date = convert_date_to_string(2024, 7, 1)
+    os.makedirs(os.path.dirname(out), exist_ok=True)
     
     # api
     api_keys = open("riot.txt", "r").read().split("\n")
     api_keys = list(filter(lambda x: len(x) > 5, api_keys))
 
-    # proxies
-    #proxies = open("proxies.txt", "r").read().split("\n")
-    #proxies = list(filter(lambda x: len(x) > 5, proxies))
-    #assign_apikeys_to_proxies(proxies, api_keys, leave_first=False)
+    install_stop_handler()
 
     # START WRITER
-    terminate = False
-    db_writer_queue = queue.Queue()
+    db_writer_queue = new_writer_queue()
     # start db writer
     db_writer = threading.Thread(
-        target=worker_write_data_to_db, args=(out, db_writer_queue, terminate)
+        target=worker_write_data_to_db,
+        args=(out, db_writer_queue, "data/checkpoint.db", sink, f"data/archive/{region}", MATCH_INDEX),
     )
     db_writer.start()
 
-
-    region = sys.argv[1]
     print(f"Starting scraper for {region}")
-    t = threading.Thread(target=start_scraper_for_region, args=(api_keys, region, db_writer_queue, start_date))
+    t = threading.Thread(
+        target=start_scraper_for_region,
+        args=(api_keys, region, db_writer_queue, start_date, resume, incremental, timelines, known_db(out, sink), snowball),
+    )
     t.start()
     t.join()
     
-    while not db_writer_queue.empty():
-        time.sleep(1)
-    terminate = True
-    
-    print("All jobs done, waiting for db writer to finish")    
-    
-    
-def start_scraper_for_region(api_keys, region, db_writer_queue, start_date):    
-    p = RiotDataScraper_2024_07(api_keys,  region)
-    p.start(db_writer_queue, start_date=start_date)
+    print("All jobs done, waiting for db writer to finish")
+    db_writer_queue.put(None)
+    db_writer.join()
 
-def worker_write_data_to_db(db_path, data_queue, terminate):
 
-    db = sqlite3.connect(db_path)
+def main_arg(resume=False, incremental=False, sink="sqlite", timelines=False, snowball=False):
+    run_region(sys.argv[1], resume, incremental, sink, timelines, snowball)
 
-    while not terminate:
-        try:
-            data = data_queue.get(block=False, timeout=None)
 
-            game_data = pd.json_normalize(data)
-            game_data.drop(
-                ["metadata.participants", "info.participants", "info.teams"],
-                axis=1,
-                inplace=True,
-            )
+def main_async(sink="sqlite"):
+    out = "data/parquet" if sink == "parquet" else "data/data.db"
+    start_date = convert_date_to_string(2024, 7, 1)
 
-            # preprocess data
-            game_participants = pd.json_normalize(
-                data, record_path=["info", "participants"], max_level=0, sep="."
-            )
-            game_participants.drop(
-                ["challenges", "missions", "perks"], axis=1, inplace=True
-            )
-            game_participants["gameId"] = data["info"]["gameId"]
+    # api
+    api_keys = open("riot.txt", "r").read().split("\n")
+    api_keys = list(filter(lambda x: len(x) > 5, api_keys))
 
-            # out to sqlite
-            game_data.to_sql(
-                con=db, name="game_data", if_exists="append", index=False
-            )
-            game_participants.to_sql(
-                con=db, name="game_participants", if_exists="append", index=False
-            )
+    install_stop_handler()
+
+    # START WRITER
+    db_writer_queue = new_writer_queue()
+    db_writer = threading.Thread(
+        target=worker_write_data_to_db, args=(out, db_writer_queue, "data/checkpoint.db", sink, "data/archive", MATCH_INDEX)
+    )
+    db_writer.start()
+
+    # ONE EVENT LOOP FOR ALL REGIONS
+    from async_scraper import scrape_regions
+    cache = ResponseCache("data/response_cache.db", ttls=SHORT_TTLS)
+    puuids = PuuidStore("data/puuids.db")
+    asyncio.run(scrape_regions(api_keys, REGIONS, db_writer_queue, start_date, cache=cache, stop=stop_event, puuids=puuids))
+    puuids.close()
+    cache.close()
+
+    db_writer_queue.put(None)
+    db_writer.join()
+
+
+def start_scraper_for_region(api_keys, region, db_writer_queue, start_date, resume=False, incremental=False, timelines=False, db_path="data/data.db", snowball=False):
+    cache = ResponseCache("data/response_cache.db", ttls=SHORT_TTLS)
+    checkpoint = CrawlCheckpoint("data/checkpoint.db")
+    puuids = PuuidStore("data/puuids.db")
+    # skip what the database and the other regions already have
+    known = KnownMatches.load(db_path, REGION_TO_PLATFORMS[region], MATCH_INDEX) if incremental else None
+    timeline_events = DEFAULT_EVENT_TYPES if timelines else None
+    # players of fetched matches, found without summoner lookups
+    frontier = SnowballFrontier() if snowball else None
+    p = RiotDataScraper_2024_07(
+        api_keys, region, cache=cache, checkpoint=checkpoint, known=known, timeline_events=timeline_events, stop=stop_event,
+        snowball=frontier, puuids=puuids,
+    )
+    p.start(db_writer_queue, start_date=start_date, resume=resume)
+    puuids.close()
+    checkpoint.close()
+    cache.close()
+
+def worker_write_data_to_db(db_path, data_queue, checkpoint_path=None, sink="sqlite", archive_path=None, index_path=None):
+
+    if sink == "parquet":
+        # partitioned parquet files under db_path, pyarrow is only needed here
+        from parquet_sink import ParquetSink
+        writer = ParquetSink(db_path, types=dict(MATCH_TYPES, game_timeline=TIMELINE_TYPES))
+    else:
+        # many matches per transaction, WAL journal
+        writer = BatchedSqliteWriter(db_path, types=dict(MATCH_TYPES, game_timeline=TIMELINE_TYPES))
+    # written matches are not fetched again on --resume
+    checkpoint = CrawlCheckpoint(checkpoint_path) if checkpoint_path else None
+    # raw payloads, to derive new tables without fetching again
+    archive = MatchArchive(archive_path) if archive_path else None
+    # match ids of the buffered batch
+    batch_matchids = []
+    # written since the index was last saved
+    written_ids = MatchIdSet()
+    index_saved = time.time()
+    # compiled column paths, no pandas per match
+    flattener = MatchFlattener()
+
+    def commit():
+        # never raises, a dead writer would leave the scrapers blocked on the full queue
+        try:
+            if archive is not None:
+                archive.commit()
+            written = writer.commit()
+            for i in written:
+                if checkpoint:
+                    checkpoint.match_done(batch_matchids[i])
+                written_ids.add(batch_matchids[i])
+        except Exception as e:
+            print(f"Commit failed: {e}")
+        finally:
+            batch_matchids.clear()
+
+    def save_index():
+        nonlocal written_ids, index_saved
+        try:
+            if index_path and len(written_ids):
+                written_ids.save(index_path)
+                written_ids = MatchIdSet()
+        except Exception as e:
+            # kept in written_ids, saved with the next ones
+            print(f"Saving {index_path} failed: {e}")
+        index_saved = time.time()
+
+    # until the None sent once every scraper is done
+    while True:
+        if checkpoint:
+            checkpoint.maybe_flush()
+        try:
+            # wait at most until the open batch is due
+            timeout = writer.time_left()
+            data = data_queue.get(timeout=0.1 if timeout is None else timeout)
+            # sent once every scraper is done
+            if data is None:
+                break
+
+            # (match, game_timeline rows) when timelines are fetched
+            timeline = None
+            if isinstance(data, tuple):
+                data, timeline = data
+
+            # out with the next batch, as row tuples
+            tables = flattener.flatten(data)
+            if timeline:
+                tables["game_timeline"] = [timeline]
+            writer.add_match(tables)
+            if archive is not None:
+                archive.put(data)
+            batch_matchids.append(data["metadata"]["matchId"])
 
         except queue.Empty as e:
-            time.sleep(0.1)
+            # idle, a good moment to persist the written matches
+            if checkpoint and not writer.pending():
+                checkpoint.flush()
+            if time.time() - index_saved > INDEX_SAVE_S:
+                save_index()
         except Exception as e:
             print(e)
 
+        if writer.due():
+            commit()
+
+    commit()
+    save_index()
+    writer.close()
+    if checkpoint:
+        checkpoint.close()
+    if archive is not None:
+        archive.close()
+    print("End of writer")
+
 class RiotDataScraper_2024_07:
-    """There steps
-    Maintain a table tracking rate rimit per endpoint.
-    Main thread reads the table and creates jobs. Pushes jobs to a queue.
-    Worker threads obtain jobs and complete them.
+    """Crawl of one region: seed players, their match histories, then their matches.
+
+    Seeding threads read the league pages and stream the players into a
+    backlog per api key. The dispatcher sleeps on a Scheduler until an
+    (api key, endpoint) is due and submits its next job to the WorkerPool
+    when the RateLimiter has a free slot and the PipelinePolicy allows it:
+    a summoner lookup with its match history, a snowball match history or
+    a match fetch. Failed jobs wait in a RetryQueue, fetched matches go to
+    the writer queue.
     """
 
-    def __init__(self, api_keys: List[str], region):
+    def __init__(self, api_keys: List[str], region, pool_size=10, workers=4, max_in_flight=None, base_url=None, cache=None, checkpoint=None, known=None, timeline_events=None, stop=None, snowball=None, puuids=None, seed_tiers=SEED_TIERS, entry_tiers=ENTRY_TIERS, policy=None):
         self.api_keys = api_keys
-        self.rai = RiotApiInterface()
+        self.base_url = base_url
+        # shared response cache, checked before a rate limit slot is used
+        self.cache = cache
+        # CrawlCheckpoint persisting seeds, seen match ids and finished summoners
+        self.checkpoint = checkpoint
+        # KnownMatches of an incremental crawl
+        self.known = known
+        # PuuidStore, known seeds skip the summoner lookup
+        self.puuids = puuids
+        # PipelinePolicy, when discovery may dispatch next to the match fetches
+        self.policy = policy or PipelinePolicy()
+        # leagues the seed players are read from
+        self.seed_tiers = seed_tiers
+        self.entry_tiers = entry_tiers
+        # event types kept from the timeline of every match, None to skip timelines
+        self.timeline_events = timeline_events
+        # threading.Event, once set no new jobs are dispatched
+        self.stop = stop
+        # SnowballFrontier fed by the participants of fetched matches, None to only crawl the seeds
+        self.snowball = snowball
+        # one limiter and one connection pool for every thread, limits are learned from the response headers
+        self.rate_limiter = RateLimiter()
+        self.session_pool = SessionPool(pool_size=pool_size)
+        self.rai = self._new_interface()
+        # reusable workers per (api key, endpoint), each with its own interface
+        self.worker_pool = WorkerPool(
+            self._new_interface, workers=workers, max_in_flight=max_in_flight, on_done=self._on_job_done
+        )
+        # failed jobs waiting for Retry-After or backoff, dispatched before new work
+        self.retry_queue = RetryQueue()
         self.region = region
         self.region_platforms = REGION_TO_PLATFORMS[region]
-
-        # use default rate limit 100 request per 2 minute
-        self.call_interval = (2 * MINUTE + 1) / 100.0
         
         # report time
         self.report_time = time.time()
@@ -193,249 +365,480 @@ class RiotDataScraper_2024_07:
             #self.rai.get_matchhistory_by_puuid,     -> UNIFIED WITH SUMMID
             self.rai.get_match_by_id,
         ]
-        # dict to store last endpoint call times and locks
-        self.request_timepoints = {
-            (api_key, func): time.time()
-            for api_key in self.api_keys
-            for func in self.rai_funcs
+        if snowball is not None:
+            # match history of the snowball players, they have no summoner lookup to unify with
+            self.rai_funcs.append(self.rai.get_matchhistory_by_puuid)
+        # next dispatch time of every (api key, endpoint)
+        self.scheduler = Scheduler(
+            (api_key, func) for api_key in self.api_keys for func in self.rai_funcs
+        )
+        # job run for each scheduled endpoint
+        self.job_workers = {
+            self.rai.get_summoner_by_encrypted_summoner_id: self.worker_summid_to_matchids_unified,
+            self.rai.get_matchhistory_by_puuid: self.worker_puuid_to_matchids,
+            self.rai.get_match_by_id: self.worker_matchid_to_matchdata,
         }
 
         # dict to store process datas
         self.process_data = {}
 
-        # set for matchids
-        self.unique_matchids = set()
+        # set for matchids, stored ones are already seen in an incremental crawl
+        self.unique_matchids = MatchIdSet()
+        if known:
+            self.unique_matchids.merge(known.match_ids)
         self.lock_matchids = threading.Lock()
 
         print(
             "Initialize RiotDataScraper for {} \nIncluded platforms: {} \
-            \nRate limit set is 1 call every {} second, which is {} call per second.".format(
+            \nRate limits are read from the response headers, starting from {}.".format(
                 region,
                 ", ".join(self.region_platforms),
-                self.call_interval,
-                1 / self.call_interval,
+                ",".join(f"{l}:{d}" for l, d in self.rate_limiter.default_app_limits),
             )
         )
-        #print("Scheduled endpoints: ", self.request_timepoints.keys())
 
-    def _endpoint_str(self, func_name, location):
-        return f"{func_name}_{location}"
+    def _new_interface(self):
+        return RiotApiInterface(self.rate_limiter, self.session_pool, self.base_url, self.cache)
+
+    def _slot_free(self, api_key, host, func):
+        return self.rate_limiter.wait_time(api_key, host, func.__name__) <= 0
 
-    def start(self, db_writer_queue, start_date):
+    def _summoner_slot_free(self, api_key, platform):
+        # unified job: summoner on the platform host, then match history on the region host
+        return self._slot_free(
+            api_key, self.rai.get_platform_host(platform), self.rai.get_summoner_by_encrypted_summoner_id
+        ) and self._slot_free(
+            api_key, self.rai.get_region_host(self.region), self.rai.get_matchhistory_by_puuid
+        )
+
+    def _match_slot_free(self, api_key):
+        # match job: the match, then its timeline if timelines are kept
+        host = self.rai.get_region_host(self.region)
+        return self._slot_free(api_key, host, self.rai.get_match_by_id) and (
+            not self.timeline_events or self._slot_free(api_key, host, self.rai.get_match_timeline_events)
+        )
+
+    def _job_slot_free(self, job_key, args):
+        api_key, func = job_key
+        if func == self.rai.get_summoner_by_encrypted_summoner_id:
+            # args of the unified job: region, platform, ...
+            return self._summoner_slot_free(api_key, args[1])
+        if func == self.rai.get_match_by_id:
+            return self._match_slot_free(api_key)
+        return self._slot_free(api_key, self.rai.get_region_host(self.region), func)
+
+    def _on_job_done(self):
+        # new match ids, retries or a free worker slot
+        self.scheduler.notify()
+
+    def _submit(self, job_key, attempt, *args):
+        return self.worker_pool.submit(job_key, self._run_job, job_key, attempt, *args)
+
+    def _run_job(self, rai, job_key, attempt, *args):
+        try:
+            self.job_workers[job_key[1]](rai, *args)
+        except Exception as e:
+            if is_app_rate_limited(e):
+                # the whole key is over its application limit, not only this endpoint
+                self.rate_limiter.pause(job_key[0], e.retry_after or 1)
+            if not self.retry_queue.push(job_key, args, e, attempt):
+                print(f"Dropping {job_key[1].__name__} job after {attempt + 1} attempts: {e}")
+
+    def _dispatch_retry(self, job_key):
+        if not self.worker_pool.has_capacity(job_key):
+            return False
+        retry = self.retry_queue.peek_ready(job_key)
+        if retry is None or not self._job_slot_free(job_key, retry[0]):
+            return False
+        args, attempt = self.retry_queue.pop_ready(job_key)
+        self._submit(job_key, attempt, *args)
+        return True
+
+    def _seed_pages(self, rai, platform, q):
+        # apex leagues are one call each, the tiers below are paginated
+        leagues = {
+            "CHALLENGER": rai.get_challenger_leagues,
+            "GRANDMASTER": rai.get_grandmaster_leagues,
+            "MASTER": rai.get_master_leagues,
+        }
+        for tier in self.seed_tiers:
+            api_key = self._seed_owners.next(platform)
+            yield api_key, leagues[tier](q, platform, api_key)["entries"]
+        for tier, division in self.entry_tiers:
+            page = 1
+            while True:
+                api_key = self._seed_owners.next(platform)
+                entries = rai.get_league_entries(platform, q, division, tier, api_key, page=page)
+                if not entries:
+                    break
+                yield api_key, entries
+                page += 1
+
+    def _fetch_seeds(self, platform, q, seeds, seen, lock):
+        """Put the players of one (platform, queue) into `seeds` as each league page arrives."""
+        rai = self._new_interface()
+        try:
+            for api_key, entries in self._seed_pages(rai, platform, q):
+                with lock:
+                    new = [e["summonerId"] for e in entries if e["summonerId"] not in seen]
+                    seen.update(new)
+                for summid in new:
+                    seeds.put(((platform, summid), {api_key: [summid]}))
+                # parked summoner jobs have work again
+                self.scheduler.notify()
+        except Exception as e:
+            print(f"{self.region} | Seeding {platform} {q} stopped: {e}")
+
+    def _start_seeding(self, seeds):
+        # every (platform, queue) at once, the rate limiter spaces the calls
+        # a page is read by one key, its players are deduplicated by summonerId
+        self._seed_owners = SeedOwners(self.api_keys, self.region_platforms)
+        seen = set()
+        lock = threading.Lock()
+        seeders = [
+            threading.Thread(target=self._fetch_seeds, args=(platform, q, seeds, seen, lock), daemon=True)
+            for platform in self.region_platforms
+            for q in SEED_QUEUES
+        ]
+        for t in seeders:
+            t.start()
+        return seeders
+
+    def start(self, db_writer_queue, start_date, resume=False):
         # queues for main thread
-        summIds = queue.Queue()
-        puuids = queue.Queue()
         matchIds = queue.Queue()
         matchdata = db_writer_queue
 
         # init progress bars
         #puuid_progress = tqdm(total=0, desc="PUUIDs Processed for {}".format(self.region))
         #match_progress = tqdm(total=0, desc="Matches Processed For {}".format(self.region))
-        #summIds_progresses = {api: tqdm(total=0, desc=f"SummIds Processed {api[:5]}") for api in self.api_keys}
-
-        # Put (summid, platform) into summIds queue
-        top_tier_players = {}
-        for api in self.api_keys:
-            for platform in self.region_platforms:
-                for q in ["RANKED_SOLO_5x5", "RANKED_FLEX_SR"]:
-                    #print(f"Getting challenger leagues for {q} on {platform}, api: {api}")
-                    resp = self.rai.get_challenger_leagues(q, platform, api)
-                    resp2 = self.rai.get_grandmaster_leagues(q, platform, api)
-                    for entry in resp["entries"] + resp2["entries"]:
-                        key = (platform, entry["leaguePoints"], entry["rank"], entry["wins"], entry["losses"], entry["veteran"], entry["inactive"], entry["freshBlood"], entry["hotStreak"])
-                        if not top_tier_players.get(key):
-                            top_tier_players[key] = {}
-                        if not top_tier_players[key].get(api):
-                            top_tier_players[key][api] = []
-                        top_tier_players.get(key).get(api).append(entry["summonerId"])
+
+        # open connections before the first real calls
+        urls = [self.rai.get_platform_url(p) for p in self.region_platforms]
+        urls.append(self.rai.get_region_url(self.region))
+        self.session_pool.warmup(self.api_keys, urls)
+
+        # seed players stream in from the league threads while the crawl runs
+        seeds = queue.Queue()
+        seeders = []
+        state = self.checkpoint.load(self.region) if self.checkpoint and resume else None
+        if state:
+            print(f"{self.region} | Resuming: {len(state['seen'])} match ids seen, {len(state['frontier'])} left")
+            resumed_players = state["players"]
+            self.process_data = state["process_data"]
+            self.unique_matchids.update(state["seen"])
+            for matchid in state["frontier"]:
+                matchIds.put(matchid)
+            done_summoners = state["done_summoners"]
+        else:
+            resumed_players = []
+            done_summoners = set()
+            if self.checkpoint:
+                self.checkpoint.reset(self.region)
+            seeders = self._start_seeding(seeds)
 
         # TEST - filter out most of items
         #top_tier_players = dict(list(top_tier_players.items())[:4])
 
-        # update process data
-        self.process_data["sumIdLen"] = sum([sum([len(_v) for _k, _v in v.items()]) for k, v in top_tier_players.items()])/len(self.api_keys)
-        
-        print("Full number of keys ", len(top_tier_players.keys()))
-        print("Keys found by API ", sum([len(v.keys()) for k, v in top_tier_players.items()])/len(self.api_keys))
-        print("Total summids", sum([sum([len(_v) for _k, _v in v.items()]) for k, v in top_tier_players.items()])/len(self.api_keys))
-
-
-        # put them in for placeholders
-        #[summIds.put(_) for keys in list(summIds_list.keys())]
-        summId_per_api = math.ceil(len(top_tier_players.keys()) / len(self.api_keys))
-        summId_idxes = {api: [i, i*summId_per_api, min((i+1)*summId_per_api, len(top_tier_players.keys()))] for i, api in enumerate(self.api_keys)}
-        print("summId_idxes: ",summId_idxes)
-
-        # list to be deterministic
-        top_tier_players = list(top_tier_players.items())
+        # (player key, {api key: [summonerId]}), in arrival order
+        top_tier_players = []
+        # shared backlog: each key lists the players it has a summonerId for (they are
+        # encrypted per key), the first key with a free slot takes a player, the others skip it
+        summoner_backlog = {api: collections.deque() for api in self.api_keys}
+        taken = []
+
+        def add_players(players):
+            for player in players:
+                _, ids = player
+                i = len(top_tier_players)
+                top_tier_players.append(player)
+                taken.append(False)
+                # finished before the restart, with whichever key took it
+                if any(summids[0] in done_summoners for summids in ids.values()):
+                    continue
+                for api in ids:
+                    # keys of a checkpoint may be gone from riot.txt
+                    if api in summoner_backlog:
+                        summoner_backlog[api].append(i)
+            # update process data
+            self.process_data["sumIdLen"] = len(top_tier_players)
+
+        def drain_seeds():
+            # checked first, so the last players of a finished thread are still drained
+            finished = not any(t.is_alive() for t in seeders)
+            new = []
+            while True:
+                try:
+                    new.append(seeds.get_nowait())
+                except queue.Empty:
+                    break
+            add_players(new)
+            if finished:
+                seeders.clear()
+                print(f"{self.region} | Seeded {len(top_tier_players)} players")
+                if self.checkpoint:
+                    self.checkpoint.save_seed(self.region, top_tier_players)
+
+        add_players(resumed_players)
+
+        def next_summoner(api_key):
+            # index of the next player left for the key, None once it has none
+            backlog = summoner_backlog[api_key]
+            while backlog and taken[backlog[0]]:
+                backlog.popleft()
+            return backlog[0] if backlog else None
+
+        def dispatch(job_key):
+            # failed jobs first
+            if self._dispatch_retry(job_key):
+                return True
+            api_key, func = job_key
+            if (
+                func == self.rai.get_summoner_by_encrypted_summoner_id
+                and next_summoner(api_key) is not None
+                and self.worker_pool.has_capacity(job_key)
+                and self._summoner_slot_free(
+                    api_key, top_tier_players[next_summoner(api_key)][0][0]
+                )
+                # the job ends with a match history call on the region host
+                and self.policy.history_allowed(
+                    self.rate_limiter, api_key, self.rai.get_region_host(self.region), matchIds.qsize()
+                )
+            ):
+                # take the player, every other key skips it from now on
+                summIdx = summoner_backlog[api_key].popleft()
+                taken[summIdx] = True
+
+                summId = top_tier_players[summIdx][1][api_key][0]
+                platform = top_tier_players[summIdx][0][0]
+                self._submit(
+                    job_key, 0,
+                    self.region, platform, api_key, matchIds, summId, start_date,
+                )
+
+                # update process data
+                self.process_data["puuidLen"] = (
+                    self.process_data.get("puuidLen", 0) + 1
+                )
+                return True
+
+            elif (  # only scheduled for snowball players, seeds are unified with summid
+                func == self.rai.get_matchhistory_by_puuid
+                and self.snowball is not None
+                and self.snowball.pending(api_key)
+                and self.worker_pool.has_capacity(job_key)
+                and self._slot_free(api_key, self.rai.get_region_host(self.region), func)
+                and self.policy.history_allowed(
+                    self.rate_limiter, api_key, self.rai.get_region_host(self.region), matchIds.qsize()
+                )
+            ):
+                puuid, depth = self.snowball.pop(api_key)
+                self._submit(
+                    job_key, 0,
+                    self.region, puuid, matchIds, api_key, start_date, depth,
+                )
+
+                # update process data
+                self.process_data["snowballLen"] = (
+                    self.process_data.get("snowballLen", 0) + 1
+                )
+                return True
+
+            elif (
+                func == self.rai.get_match_by_id
+                and not matchIds.empty()
+                and self.worker_pool.has_capacity(job_key)
+                and self._match_slot_free(api_key)
+                # backpressure: no new fetches while the writer is behind
+                and not matchdata.full()
+                # no phase gating, matches are fetched while summoners are still looked up
+            ):
+                # only unique matchIds
+                matchid = matchIds.get()
+                self._submit(
+                    job_key, 0,
+                    self.region, matchid, api_key, matchdata,
+                )
+
+                # update metadata
+                self.process_data["matchDataLen"] = (
+                    self.process_data.get("matchDataLen", 0) + 1
+                )
+                return True
+            return False
+
+        def key_wait(job_key):
+            api_key, func = job_key
+            if func == self.rai.get_summoner_by_encrypted_summoner_id and next_summoner(api_key) is not None:
+                platform = top_tier_players[next_summoner(api_key)][0][0]
+                return max(
+                    self.rate_limiter.wait_time(api_key, self.rai.get_platform_host(platform), func.__name__),
+                    self.rate_limiter.wait_time(
+                        api_key, self.rai.get_region_host(self.region), self.rai.get_matchhistory_by_puuid.__name__
+                    ),
+                )
+            wait = self.rate_limiter.wait_time(api_key, self.rai.get_region_host(self.region), func.__name__)
+            if func == self.rai.get_match_by_id and matchdata.full():
+                # poll until the writer makes room, nothing else wakes the key up
+                wait = max(wait, 0.05)
+            if func == self.rai.get_match_by_id and self.timeline_events:
+                wait = max(
+                    wait,
+                    self.rate_limiter.wait_time(
+                        api_key, self.rai.get_region_host(self.region), self.rai.get_match_timeline_events.__name__
+                    ),
+                )
+            return wait
 
         print("Starting data collection")
-        # job distributor thread
+        # job distributor thread: sleeps until the next (api key, endpoint) is due
         while (
-            #not summIds.empty()
-            len(summId_idxes.items()) > 0
-            or not puuids.empty()
+            seeders
+            or any(next_summoner(api) is not None for api in self.api_keys)
+            or (self.snowball is not None and len(self.snowball) > 0)
             or not matchIds.empty()
             or not matchdata.empty()
+            or self.worker_pool.busy()
+            or len(self.retry_queue) > 0
         ):
-            #print("Condition states: ", len(summId_idxes.items()) > 0, not puuids.empty(), not matchIds.empty(), not matchdata.empty())
-            scheduler_items = list(self.request_timepoints.items())
-            # check if endpoints are free and there are jobs to be done
-            for item in scheduler_items:
-                if (
-                    item[0][1] == self.rai.get_summoner_by_encrypted_summoner_id
-                    and time.time() - item[1] > self.call_interval
-                    #and not summIds.empty()
-                    and summId_idxes.get(item[0][0], None)
-                ):
-                    api_key = item[0][0]
-                    
-                    # aqcuire item (bcs of concurrency)
-                    #summId, platform = summIds.get()
-                    summIdx = summId_idxes[api_key][1]
-                    summId_idxes[api_key][1] += 1
-                    # pop if no item left for this particular thread
-                    if summId_idxes[api_key][1] >= summId_idxes[api_key][2]:
-                        summId_idxes.pop(api_key)
-                        
-                    if not top_tier_players[summIdx][1].get(api_key, None):
-                        continue
-                    
-                    summId = top_tier_players[summIdx][1][api_key][0]
-                    platform = top_tier_players[summIdx][0][0]
-                    #t = threading.Thread(
-                    #    target=self.worker_summoner_id_to_puuid,
-                    #    args=(platform, api_key, puuids, summId),
-                    #)
-                    t = threading.Thread(
-                        target=self.worker_summid_to_matchids_unified,
-                        args=(self.region, platform, api_key, matchIds, summId, start_date),
-                    )
-                    t.start()
-                    self.request_timepoints[item[0]] = time.time()
-
-                    # update process data
-                    self.process_data["puuidLen"] = (
-                        self.process_data.get("puuidLen", 0) + 1
-                    )
-
-                elif (  # turned off since unified with summid
-                    item[0][1] == self.rai.get_matchhistory_by_puuid
-                    and time.time() - item[1] > self.call_interval
-                    and not puuids.empty()
-                ):
-                    puuid = puuids.get()
-                    t = threading.Thread(
-                        target=self.worker_puuid_to_matchids,
-                        args=(self.region, puuid, matchIds, item[0][0], start_date),
-                    )
-                    t.start()
-                    self.request_timepoints[item[0]] = time.time()
-                    print("Getting matchids")
-                    print(len(self.unique_matchids))
-
-                elif (
-                    item[0][1] == self.rai.get_match_by_id
-                    and time.time() - item[1] > self.call_interval
-                    and not matchIds.empty()
-                    #and summIds.empty()
-                    and not summId_idxes.get(item[0][0], None)
-                    and puuids.empty()  # only start when all puuids are fetched and matchids are obtained (bcs it works from the match endpoint as well - rate limit issues)
-                ):
-                    # only unique matchIds
-                    matchid = matchIds.get()
-                    threading.Thread(
-                        target=self.worker_matchid_to_matchdata,
-                        args=(self.region, matchid, item[0][0], matchdata),
-                    ).start()
-                    self.request_timepoints[item[0]] = time.time()
-
-                    # update metadata
-                    self.process_data["matchDataLen"] = (
-                        self.process_data.get("matchDataLen", 0) + 1
-                    )
-
-            # create / update tqdm progress bars for
-            # 1. progress bar: self.process_data["puuidLen"] / self.process_data["sumIdLen"]
-            # 2. progress bar: self.process_data["matchDataLen"] / len(self.unique_matchids)
-            #puuid_progress.total = self.process_data.get("sumIdLen", 0)
-            #puuid_progress.n = self.process_data.get("puuidLen", 0)
-            #puuid_progress.refresh()
-
-            #match_progress.total = len(self.unique_matchids)
-            #match_progress.n = self.process_data.get("matchDataLen", 0)
-            #match_progress.refresh()
-            
-            
-            # report every 60 seconds: percentage, current n, total n
-            
-            puuid_total = self.process_data.get("sumIdLen", 0)
-            puuid_n = self.process_data.get("puuidLen", 0)
-            
-            
-            match_progress_total = len(self.unique_matchids)
-            match_progress_n = self.process_data.get("matchDataLen", 0)
-            
+            if self.stop is not None and self.stop.is_set():
+                print(f"{self.region} | Stopping, {matchIds.qsize()} match ids left for --resume")
+                break
+            if seeders:
+                drain_seeds()
+            due = self.scheduler.next_due(timeout=1.0)
+            if due is not None:
+                job_key, version = due
+                dispatched = dispatch(job_key)
+                wait = key_wait(job_key)
+                retry_at = self.retry_queue.next_ready(job_key)
+                if dispatched or wait > 0:
+                    self.scheduler.reschedule(job_key, time.time() + wait)
+                elif retry_at is not None:
+                    self.scheduler.reschedule(job_key, retry_at)
+                else:
+                    # no work or no capacity, a finished job wakes it up
+                    self.scheduler.park(job_key, version)
+
+            # report every 10 seconds: percentage, current n, total n
+            if self.checkpoint:
+                self.checkpoint.maybe_flush()
             if time.time() - self.report_time > 10:
                 self.report_time = time.time()
+                if self.checkpoint:
+                    self.checkpoint.save_state(self.region, self.process_data)
+                puuid_total = self.process_data.get("sumIdLen", 0)
+                puuid_n = self.process_data.get("puuidLen", 0)
+                match_progress_total = len(self.unique_matchids)
+                match_progress_n = self.process_data.get("matchDataLen", 0)
                 puuid_percentage = (puuid_n / (puuid_total+1)) * 100
                 match_progress_percentage = (match_progress_n / (match_progress_total+1)) * 100
                 if match_progress_percentage <= 95:
                     print(f"{self.region} | PUUIDs: {puuid_n}/{puuid_total} ({puuid_percentage:.2f}%), Match Data: {match_progress_n}/{match_progress_total} ({match_progress_percentage:.2f}%)")
-            
-            
-            #for api, progress in summIds_progresses.items():
-            #    if summId_idxes.get(api, None):
-            #        progress.total = summId_per_api
-            #        progress.n = summId_idxes[api][1] - summId_idxes[api][0]*summId_per_api 
-            #        progress.refresh()
-                
-            time.sleep(0.1)
 
         print("All jobs done, waiting for db writer to finish")
-
-    def worker_summid_to_matchids_unified(self, region, platform, api_key, matchid_queue, summid, start_date):
-        rai = RiotApiInterface()
-        summoner = rai.get_summoner_by_encrypted_summoner_id(summid, platform, api_key)
-        puuid = summoner["puuid"]
+        # in-flight jobs finish first, their match ids belong in the checkpoint
+        self.worker_pool.close()
+        if self.checkpoint:
+            self.checkpoint.save_state(self.region, self.process_data)
+            self.checkpoint.flush()
+        self.session_pool.close()
+
+    def worker_summid_to_matchids_unified(self, rai, region, platform, api_key, matchid_queue, summid, start_date):
+        puuid = self.puuids.get(summid) if self.puuids is not None else None
+        if puuid is None:
+            summoner = rai.get_summoner_by_encrypted_summoner_id(summid, platform, api_key)
+            puuid = summoner["puuid"]
+            if self.puuids is not None:
+                self.puuids.put(summid, platform, puuid)
+        if self.snowball is not None:
+            self.snowball.seen(api_key, puuid)
+        # an incremental crawl pages back to its stored matches only
+        stored = None
+        if self.known:
+            start_date = self.known.start_time(puuid, start_date)
+            stored = self.known.match_ids
         
-        matchlist = rai.get_matchhistory_by_puuid(
-            region, puuid, api_key, startTime=start_date, type="ranked"
+        matchlist = rai.get_full_matchhistory_by_puuid(
+            region, puuid, api_key, startTime=start_date, type="ranked", stop_at=stored
         )
         with self.lock_matchids:
+            new_matchids = []
             for matchid in matchlist:
                 if matchid not in self.unique_matchids:
                     self.unique_matchids.add(matchid)
-                    matchid_queue.put(matchid)
-
-    def worker_summoner_id_to_puuid(self, platform, api_key, puuid_queue, summid):
-        rai = RiotApiInterface()
-        summoner = rai.get_summoner_by_encrypted_summoner_id(summid, platform, api_key)
-        puuid_queue.put(summoner["puuid"])
+                    new_matchids.append(matchid)
+            if self.checkpoint:
+                self.checkpoint.add_matches(region, new_matchids)
+                self.checkpoint.summoner_done(region, summid)
+            for matchid in new_matchids:
+                matchid_queue.put(matchid)
 
     def worker_puuid_to_matchids(
         self,
+        rai,
         region,
         puuid,
         matchid_queue,
         api_key,
         start_date,
+        depth=0,
     ):
-        rai = RiotApiInterface()
-        matchlist = rai.get_matchhistory_by_puuid(
-            region, puuid, api_key, startTime=start_date, type="ranked"
+        # an incremental crawl pages back to its stored matches only
+        stored = None
+        if self.known:
+            start_date = self.known.start_time(puuid, start_date)
+            stored = self.known.match_ids
+        matchlist = rai.get_full_matchhistory_by_puuid(
+            region, puuid, api_key, startTime=start_date, type="ranked", stop_at=stored
         )
         with self.lock_matchids:
+            new_matchids = []
             for matchid in matchlist:
                 if matchid not in self.unique_matchids:
                     self.unique_matchids.add(matchid)
-                    matchid_queue.put(matchid)
-
-    def worker_matchid_to_matchdata(self, region, matchId, api_key, matchdata):
-        rai = RiotApiInterface()
+                    new_matchids.append(matchid)
+            if self.checkpoint:
+                self.checkpoint.add_matches(region, new_matchids)
+            if self.snowball is not None:
+                self.snowball.add_match_ids(new_matchids, depth)
+            for matchid in new_matchids:
+                matchid_queue.put(matchid)
+
+    def worker_matchid_to_matchdata(self, rai, region, matchId, api_key, matchdata):
         matchData = rai.get_match_by_id(region, matchId, api_key)
+        if self.snowball is not None:
+            self.snowball.add_match(api_key, matchData)
+        if self.timeline_events:
+            try:
+                events = rai.get_match_timeline_events(region, matchId, api_key, self.timeline_events)
+            except Exception as e:
+                # the match is already fetched, it is stored without its timeline
+                print(f"{self.region} | Timeline of {matchId} skipped: {e}")
+            else:
+                matchdata.put((matchData, timeline_rows(matchData["info"]["gameId"], matchData["info"]["platformId"], events)))
+                return
         matchdata.put(matchData)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sink = "parquet" if "--parquet" in sys.argv else "sqlite"
+    if "--async" in sys.argv:
+        main_async(sink=sink)
+    elif len(sys.argv) > 1 and sys.argv[1] in REGIONS:
+        # python main.py europe: one region into data/shards/data_europe.db
+        main_arg(
+            resume="--resume" in sys.argv,
+            incremental="--incremental" in sys.argv,
+            sink=sink,
+            timelines="--timelines" in sys.argv,
+            snowball="--snowball" in sys.argv,
+        )
+    else:
+        main(
+            resume="--resume" in sys.argv,
+            incremental="--incremental" in sys.argv,
+            sink=sink,
+            timelines="--timelines" in sys.argv,
+            snowball="--snowball" in sys.argv,
+        )
\ No newline at end of file
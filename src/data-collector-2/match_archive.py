@@ -0,0 +1,231 @@
+"""Append-only archive of the raw match-v5 payloads.
+
+The writer only keeps a projection of each match, the archive keeps the
+whole document so new tables can be derived without fetching again.
+Payloads are zstd frames compressed with a dictionary trained on match
+payloads, appended to segment files and indexed by matchId in a sqlite
+file next to them.
+
+    python match_archive.py stats data/archive
+    python match_archive.py rebuild data/archive data/rebuilt.db
+    python match_archive.py rebuild data/archive data/parquet --parquet
+"""
+
+import argparse
+import glob
+import json
+import os
+import sqlite3
+import time
+
+import zstandard as zstd
+
+
+class MatchArchive:
+    """Raw match payloads in zstd segment files, indexed by matchId.
+
+    Payloads are buffered by put() and written by commit(), which the writer
+    calls with its own commit so a match marked done is archived as well.
+    Until a dictionary exists the first `train_samples` payloads are kept
+    as samples and the dictionary is trained at the commit that reaches
+    them; payloads committed before that are compressed without one. Every
+    dictionary is stored in the index, so old records stay readable after
+    train() replaces it.
+    """
+
+    def __init__(self, path="data/archive", level=9, dict_size=112 * 1024, train_samples=500, segment_bytes=1024**3):
+        self.path = path
+        self.level = level
+        self.dict_size = dict_size
+        self.train_samples = train_samples
+        self.segment_bytes = segment_bytes
+        os.makedirs(path, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(path, "index.db"))
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS dictionaries (id INTEGER PRIMARY KEY, data BLOB);
+            CREATE TABLE IF NOT EXISTS matches (
+                match_id TEXT PRIMARY KEY, segment INTEGER, offset INTEGER, length INTEGER, dictionary INTEGER
+            );
+            """
+        )
+        self._db.commit()
+        # dictionary id 0 is plain zstd
+        self._compressors = {0: zstd.ZstdCompressor(level=level)}
+        self._decompressors = {0: zstd.ZstdDecompressor()}
+        row = self._db.execute("SELECT id, data FROM dictionaries ORDER BY id DESC LIMIT 1").fetchone()
+        self._dictionary = 0
+        if row is not None:
+            self._dictionary = row[0]
+            self._compressors[row[0]] = zstd.ZstdCompressor(level=level, dict_data=zstd.ZstdCompressionDict(row[1]))
+        self._samples = []
+        self._pending = {}
+        segments = sorted(glob.glob(os.path.join(path, "segment-*.zst")))
+        self._segment = int(segments[-1][-9:-4]) if segments else 0
+        self._file = None
+
+    def _segment_path(self, segment):
+        return os.path.join(self.path, f"segment-{segment:05d}.zst")
+
+    def __contains__(self, match_id):
+        if match_id in self._pending:
+            return True
+        return self._db.execute("SELECT 1 FROM matches WHERE match_id = ?", (match_id,)).fetchone() is not None
+
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM matches").fetchone()[0]
+
+    def put(self, match):
+        """Buffer the raw payload of one match, a decoded match-v5 dict."""
+        match_id = match["metadata"]["matchId"]
+        if match_id in self:
+            return
+        raw = json.dumps(match, separators=(",", ":")).encode()
+        self._pending[match_id] = raw
+        if self._dictionary == 0 and len(self._samples) < self.train_samples:
+            self._samples.append(raw)
+
+    def train(self, samples=None):
+        """Train a new dictionary on `samples` (raw payloads), by default the buffered ones."""
+        samples = samples if samples is not None else self._samples
+        dictionary = zstd.train_dictionary(self.dict_size, samples, level=self.level)
+        cursor = self._db.execute("INSERT INTO dictionaries (data) VALUES (?)", (dictionary.as_bytes(),))
+        self._db.commit()
+        self._dictionary = cursor.lastrowid
+        self._compressors[self._dictionary] = zstd.ZstdCompressor(level=self.level, dict_data=dictionary)
+        self._samples = []
+        print(f"Match archive | trained dictionary {self._dictionary} on {len(samples)} matches")
+
+    def _open_segment(self):
+        if self._file is not None and self._file.tell() < self.segment_bytes:
+            return self._file
+        if self._file is not None:
+            self._file.close()
+            self._segment += 1
+        self._file = open(self._segment_path(self._segment), "ab")
+        if self._file.tell() >= self.segment_bytes:
+            return self._open_segment()
+        return self._file
+
+    def commit(self):
+        """Append the buffered payloads to the current segment and index them."""
+        if not self._pending:
+            return
+        if self._dictionary == 0 and len(self._samples) >= self.train_samples:
+            self.train()
+        compressor = self._compressors[self._dictionary]
+        file = self._open_segment()
+        rows = []
+        for match_id, raw in self._pending.items():
+            frame = compressor.compress(raw)
+            rows.append((match_id, self._segment, file.tell(), len(frame), self._dictionary))
+            file.write(frame)
+        # the bytes are on disk before the index points at them
+        file.flush()
+        os.fsync(file.fileno())
+        with self._db:
+            self._db.executemany("INSERT OR IGNORE INTO matches VALUES (?, ?, ?, ?, ?)", rows)
+        self._pending = {}
+
+    def _decompressor(self, dictionary):
+        decompressor = self._decompressors.get(dictionary)
+        if decompressor is None:
+            (data,) = self._db.execute("SELECT data FROM dictionaries WHERE id = ?", (dictionary,)).fetchone()
+            decompressor = zstd.ZstdDecompressor(dict_data=zstd.ZstdCompressionDict(data))
+            self._decompressors[dictionary] = decompressor
+        return decompressor
+
+    def get(self, match_id):
+        """The archived match, None if it is not in the archive."""
+        row = self._db.execute(
+            "SELECT segment, offset, length, dictionary FROM matches WHERE match_id = ?", (match_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        segment, offset, length, dictionary = row
+        with open(self._segment_path(segment), "rb") as f:
+            f.seek(offset)
+            frame = f.read(length)
+        return json.loads(self._decompressor(dictionary).decompress(frame))
+
+    def iter_raw(self):
+        """Decompressed json of all archived matches in the order they were written, read sequentially."""
+        rows = self._db.execute(
+            "SELECT segment, offset, length, dictionary FROM matches ORDER BY segment, offset"
+        ).fetchall()
+        segment, f = None, None
+        try:
+            for row_segment, offset, length, dictionary in rows:
+                if row_segment != segment:
+                    if f is not None:
+                        f.close()
+                    segment = row_segment
+                    f = open(self._segment_path(segment), "rb")
+                f.seek(offset)
+                yield self._decompressor(dictionary).decompress(f.read(length))
+        finally:
+            if f is not None:
+                f.close()
+
+    def __iter__(self):
+        # json decoding, not decompression, bounds the read speed
+        for raw in self.iter_raw():
+            yield json.loads(raw)
+
+    def stats(self):
+        size = sum(os.path.getsize(p) for p in glob.glob(os.path.join(self.path, "segment-*.zst")))
+        matches, dictionaries = self._db.execute(
+            "SELECT COUNT(*), COUNT(DISTINCT dictionary) FROM matches"
+        ).fetchone()
+        return {"matches": matches, "bytes": size, "dictionaries": dictionaries}
+
+    def close(self):
+        self.commit()
+        if self._file is not None:
+            self._file.close()
+        self._db.close()
+
+
+def rebuild(archive, writer):
+    """Write every archived match again through `writer`, a BatchedSqliteWriter or ParquetSink."""
+    from match_flattener import MatchFlattener
+
+    flattener = MatchFlattener()
+    start = time.time()
+    n = 0
+    for n, match in enumerate(archive, 1):
+        writer.add_match(flattener.flatten(match))
+        if writer.due():
+            writer.commit()
+    writer.close()
+    print(f"Rebuilt {n} matches in {time.time() - start:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    stats = commands.add_parser("stats", help="size of the archive")
+    stats.add_argument("archive")
+    rebuild_parser = commands.add_parser("rebuild", help="write the game tables again from the archive")
+    rebuild_parser.add_argument("archive")
+    rebuild_parser.add_argument("out", help="sqlite file, or directory with --parquet")
+    rebuild_parser.add_argument("--parquet", action="store_true")
+    args = parser.parse_args()
+
+    archive = MatchArchive(args.archive)
+    if args.command == "stats":
+        stats = archive.stats()
+        print(f"{stats['matches']} matches in {stats['bytes'] / 1024**2:.1f} MiB, {stats['dictionaries']} dictionaries")
+    elif args.parquet:
+        from match_types import MATCH_TYPES
+        from parquet_sink import ParquetSink
+        rebuild(archive, ParquetSink(args.out, types=MATCH_TYPES))
+    else:
+        from match_types import MATCH_TYPES
+        from db_writer import BatchedSqliteWriter
+        rebuild(archive, BatchedSqliteWriter(args.out, types=MATCH_TYPES))
+    archive.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+from operator import itemgetter
+
+
+# subtrees json_normalize used to materialize and the writer then dropped
+GAME_DATA_SKIP = {("metadata", "participants"), ("info", "participants"), ("info", "teams")}
+PARTICIPANT_SKIP = {"challenges", "missions", "perks"}
+
+
+def _single(getter):
+    # itemgetter with one key returns the value itself, not a tuple
+    return lambda d: (getter(d),)
+
+
+class MatchFlattener:
+    """Turn match-v5 dicts into row tuples for game_data and game_participants.
+
+    Gives the same columns as the old pd.json_normalize + drop:
+    game_data has every nested key of the match joined with ".", without
+    the skipped subtrees; game_participants has the top level keys of each
+    participant plus gameId and platformId (gameIds repeat across
+    platforms). The column paths are compiled once per key layout, so a
+    match is read with a few itemgetter calls and the skipped subtrees are
+    never visited.
+    """
+
+    def __init__(self, game_data_skip=GAME_DATA_SKIP, participant_skip=PARTICIPANT_SKIP):
+        self.game_data_skip = game_data_skip
+        self.participant_skip = participant_skip
+        # key layout -> (columns, [(path to dict, getter)])
+        self._game_data_plans = {}
+        # participant keys -> (columns, getter)
+        self._participant_plans = {}
+
+    def _layout(self, node, path=()):
+        # keys of every dict that is flattened, in visiting order
+        keys = tuple(node.keys())
+        layout = [keys]
+        for key in keys:
+            value = node[key]
+            if isinstance(value, dict) and path + (key,) not in self.game_data_skip:
+                layout.extend(self._layout(value, path + (key,)))
+        return layout
+
+    def _compile_game_data(self, match):
+        columns = []
+        steps = []
+
+        def visit(node, path):
+            leaves = []
+            for key, value in node.items():
+                if path + (key,) in self.game_data_skip:
+                    continue
+                if isinstance(value, dict):
+                    continue
+                leaves.append(key)
+            if leaves:
+                getter = itemgetter(*leaves)
+                steps.append((path, getter if len(leaves) > 1 else _single(getter)))
+                columns.extend(".".join(path + (k,)) for k in leaves)
+            for key, value in node.items():
+                if isinstance(value, dict) and path + (key,) not in self.game_data_skip:
+                    visit(value, path + (key,))
+
+        visit(match, ())
+        return tuple(columns), steps
+
+    def game_data(self, match):
+        """(columns, [row]) of the game_data table."""
+        layout = tuple(self._layout(match))
+        plan = self._game_data_plans.get(layout)
+        if plan is None:
+            plan = self._game_data_plans[layout] = self._compile_game_data(match)
+        columns, steps = plan
+        row = ()
+        for path, getter in steps:
+            node = match
+            for key in path:
+                node = node[key]
+            row += getter(node)
+        return columns, [row]
+
+    def game_participants(self, match):
+        """{columns: [rows]} of the game_participants table, usually a single column set."""
+        match_key = (match["info"]["gameId"], match["info"]["platformId"])
+        tables = {}
+        for participant in match["info"]["participants"]:
+            keys = tuple(participant.keys())
+            plan = self._participant_plans.get(keys)
+            if plan is None:
+                kept = [k for k in keys if k not in self.participant_skip]
+                getter = itemgetter(*kept)
+                plan = (tuple(kept) + ("gameId", "platformId"), getter if len(kept) > 1 else _single(getter))
+                self._participant_plans[keys] = plan
+            columns, getter = plan
+            tables.setdefault(columns, []).append(getter(participant) + match_key)
+        return tables
+
+    def flatten(self, match):
+        """{table: [(columns, rows)]} for BatchedSqliteWriter.add_match."""
+        return {
+            "game_data": [self.game_data(match)],
+            "game_participants": list(self.game_participants(match).items()),
+        }
@@ -0,0 +1,212 @@
+import fcntl
+import os
+import struct
+from array import array
+
+from RiotApiInterface import PLATFORMS
+
+
+# match ids are {PLATFORM}_{game number}, e.g. EUN1_3603423536
+PLATFORM_CODES = {p.upper(): i + 1 for i, p in enumerate(PLATFORMS)}
+PLATFORM_NAMES = {code: p for p, code in PLATFORM_CODES.items()}
+
+_GAME_BITS = 56
+_GOLDEN = 0x9E3779B97F4A7C15
+_MASK64 = (1 << 64) - 1
+_HEADER = struct.Struct("<4sIQQ")
+_MAGIC = b"MIDX"
+
+
+def encode_match_id(match_id):
+    """(platform code, game number) packed in one non zero int64.
+
+    Raises KeyError for a platform missing from PLATFORMS and ValueError
+    for a game number that does not fit in 56 bits.
+    """
+    platform, game = match_id.split("_", 1)
+    game = int(game)
+    if not 0 <= game < 1 << _GAME_BITS:
+        raise ValueError(f"Game number of {match_id} does not fit in {_GAME_BITS} bits")
+    return PLATFORM_CODES[platform.upper()] << _GAME_BITS | game
+
+
+def decode_match_id(key):
+    return f"{PLATFORM_NAMES[key >> _GAME_BITS]}_{key & ((1 << _GAME_BITS) - 1)}"
+
+
+class BloomFilter:
+    """Bit array with `hashes` probes per key, no false negatives."""
+
+    def __init__(self, bits, hashes=3):
+        self.bits = bits
+        self.hashes = hashes
+        self._array = bytearray((bits + 7) // 8)
+
+    def _positions(self, key):
+        # double hashing from the two halves of one 64 bit hash
+        h = (key * _GOLDEN) & _MASK64
+        h1, h2 = h & 0xFFFFFFFF, h >> 32 | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def add(self, key):
+        for p in self._positions(key):
+            self._array[p >> 3] |= 1 << (p & 7)
+
+    def __contains__(self, key):
+        bits = self._array
+        for p in self._positions(key):
+            if not bits[p >> 3] & (1 << (p & 7)):
+                return False
+        return True
+
+
+class MatchIdSet:
+    """Set of match ids in an open addressing hash table of int64 keys.
+
+    A match id is stored as its platform code and game number in 8 bytes
+    instead of a ~70 byte python string plus its set entry. The table grows
+    at 3/4 load, so a million ids take 8 to 16 MB. With `bloom_bits` a bloom
+    filter answers misses before the table is probed; in CPython a probe is
+    already about one array read, so it only pays off for very full tables.
+
+    Ids that cannot be encoded, e.g. of a platform added after PLATFORMS,
+    are kept as strings next to the table rather than rejected.
+
+    The table is saved as is, so loading is a single read. save() merges
+    with the file under an exclusive lock, several processes can share it.
+    """
+
+    def __init__(self, capacity=1 << 16, bloom_bits=0):
+        capacity = 1 << max(4, (capacity - 1).bit_length())
+        self._slots = array("Q", bytes(8 * capacity))
+        self._shift = 64 - (capacity.bit_length() - 1)
+        self._mask = capacity - 1
+        self._count = 0
+        # ids encode_match_id rejects
+        self._other = set()
+        self.bloom = BloomFilter(bloom_bits) if bloom_bits else None
+
+    def _find(self, key):
+        slots = self._slots
+        mask = self._mask
+        i = ((key * _GOLDEN) & _MASK64) >> self._shift
+        while True:
+            k = slots[i]
+            if k == key or k == 0:
+                return i
+            i = (i + 1) & mask
+
+    def _resize(self, capacity):
+        old = self._slots
+        self._slots = array("Q", bytes(8 * capacity))
+        self._shift = 64 - (capacity.bit_length() - 1)
+        self._mask = capacity - 1
+        for key in old:
+            if key:
+                self._slots[self._find(key)] = key
+
+    def add_key(self, key):
+        """Add an encoded id. Returns False if it was already in the set."""
+        i = self._find(key)
+        if self._slots[i]:
+            return False
+        self._slots[i] = key
+        self._count += 1
+        if self.bloom is not None:
+            self.bloom.add(key)
+        if self._count * 4 > len(self._slots) * 3:
+            self._resize(2 * len(self._slots))
+        return True
+
+    def add(self, match_id):
+        try:
+            key = encode_match_id(match_id)
+        except (KeyError, ValueError):
+            if match_id in self._other:
+                return False
+            self._other.add(match_id)
+            return True
+        return self.add_key(key)
+
+    def update(self, match_ids):
+        for match_id in match_ids:
+            self.add(match_id)
+
+    def merge(self, other):
+        """Add every id of another MatchIdSet without decoding them."""
+        # keys come in hash order, a smaller table would pile them into a few long runs
+        capacity = len(self._slots)
+        while (self._count + other._count) * 4 > capacity * 3 or capacity < len(other._slots):
+            capacity *= 2
+        if capacity > len(self._slots):
+            self._resize(capacity)
+        for key in other._slots:
+            if key:
+                self.add_key(key)
+        self._other |= other._other
+
+    def __contains__(self, match_id):
+        try:
+            key = encode_match_id(match_id)
+        except (KeyError, ValueError):
+            return match_id in self._other
+        if self.bloom is not None and key not in self.bloom:
+            return False
+        return self._slots[self._find(key)] == key
+
+    def __len__(self):
+        return self._count + len(self._other)
+
+    def __iter__(self):
+        for key in self._slots:
+            if key:
+                yield decode_match_id(key)
+        yield from self._other
+
+    def nbytes(self):
+        return self._slots.itemsize * len(self._slots)
+
+    @classmethod
+    def _read(cls, f, bloom_bits=0):
+        magic, version, count, capacity = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != _MAGIC:
+            raise ValueError(f"{f.name} is not a match id index")
+        index = cls(capacity)
+        index._slots = array("Q")
+        index._slots.frombytes(f.read(8 * capacity))
+        index._count = count
+        if version >= 2:
+            # the ids kept as strings follow the table, one per line
+            index._other = set(f.read().decode().split("\n")) - {""}
+        if bloom_bits:
+            index.bloom = BloomFilter(bloom_bits)
+            for key in index._slots:
+                if key:
+                    index.bloom.add(key)
+        return index
+
+    @classmethod
+    def load(cls, path, bloom_bits=0):
+        """Index saved at `path`, an empty one if there is none yet."""
+        if not os.path.exists(path):
+            return cls(bloom_bits=bloom_bits)
+        with open(path, "rb") as f:
+            return cls._read(f, bloom_bits)
+
+    def save(self, path):
+        """Merge the ids into the index at `path`, which other processes may be saving too."""
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            merged = MatchIdSet(capacity=len(self._slots))
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    merged = MatchIdSet._read(f)
+            merged.merge(self)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(_HEADER.pack(_MAGIC, 2, merged._count, len(merged._slots)))
+                merged._slots.tofile(f)
+                f.write("\n".join(sorted(merged._other)).encode())
+            os.replace(tmp, path)
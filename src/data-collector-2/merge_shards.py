@@ -0,0 +1,105 @@
+"""Merge the per-region shard databases into one, keeping every match once.
+
+Each region process writes its own data/shards/data_{region}.db. The merge
+attaches one shard at a time and copies its rows with INSERT ... SELECT
+inside sqlite, after adding the columns the merged tables are missing.
+A match already in the output (same metadata.matchId) is skipped with all
+of its rows, so the merge can run again while the shards grow. gameIds
+repeat across platforms, rows of the other tables belong to a match by
+(platformId, gameId).
+
+    python merge_shards.py data/data.db data/shards/*.db
+"""
+
+import argparse
+import sqlite3
+import time
+
+from schema_registry import SchemaRegistry
+
+
+MATCH_TABLE = "game_data"
+MATCH_ID = "metadata.matchId"
+GAME_ID = "info.gameId"
+PLATFORM_ID = "info.platformId"
+
+
+def merge_shard(db, schema, shard_path):
+    """Copy the matches of one shard missing from `db`. Returns how many were new."""
+    db.execute("ATTACH DATABASE ? AS shard", (shard_path,))
+    try:
+        tables = {
+            table: {row[1]: row[2] for row in db.execute(f'PRAGMA shard.table_info("{table}")')}
+            for (table,) in db.execute("SELECT name FROM shard.sqlite_master WHERE type = 'table'")
+        }
+        if MATCH_TABLE not in tables:
+            print(f"{shard_path} has no {MATCH_TABLE} table, skipped")
+            return 0
+        for table, types in tables.items():
+            schema.ensure(table, types)
+        db.execute(f'CREATE INDEX IF NOT EXISTS game_data_match_id ON {MATCH_TABLE} ("{MATCH_ID}")')
+        with db:
+            # first row of every match of the shard that is not merged yet
+            db.execute("DROP TABLE IF EXISTS temp.new_games")
+            db.execute(
+                f"""
+                CREATE TEMP TABLE new_games AS
+                SELECT MIN(s.rowid) AS row, s."{GAME_ID}" AS gameId, s."{PLATFORM_ID}" AS platformId, COUNT(*) AS copies
+                FROM shard.{MATCH_TABLE} s
+                WHERE NOT EXISTS (SELECT 1 FROM main.{MATCH_TABLE} m WHERE m."{MATCH_ID}" = s."{MATCH_ID}")
+                GROUP BY s."{MATCH_ID}"
+                """
+            )
+            db.execute("CREATE INDEX temp.new_games_game_id ON new_games (gameId, platformId)")
+            for table, types in tables.items():
+                columns = ", ".join(f'"{c}"' for c in types)
+                if table == MATCH_TABLE:
+                    db.execute(
+                        f'INSERT INTO main."{table}" ({columns}) SELECT {columns} FROM shard."{table}" '
+                        "WHERE rowid IN (SELECT row FROM temp.new_games)"
+                    )
+                elif "gameId" in types:
+                    # rows written before platformId was added only have their gameId
+                    key = "n.gameId = c.gameId"
+                    if "platformId" in types:
+                        key += " AND (c.platformId IS NULL OR c.platformId = n.platformId)"
+                    # a match written twice, e.g. fetched again after a crash, has its rows twice
+                    for copies, distinct in (("= 1", ""), ("> 1", "DISTINCT ")):
+                        db.execute(
+                            f'INSERT INTO main."{table}" ({columns}) SELECT {distinct}{columns} FROM shard."{table}" c '
+                            f"WHERE EXISTS (SELECT 1 FROM temp.new_games n WHERE {key} AND n.copies {copies})"
+                        )
+                else:
+                    print(f"{table} of {shard_path} has no gameId, not merged")
+            (new,) = db.execute("SELECT COUNT(*) FROM temp.new_games").fetchone()
+    finally:
+        db.execute("DETACH DATABASE shard")
+    return new
+
+
+def merge(out, shards):
+    db = sqlite3.connect(out)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    schema = SchemaRegistry(db)
+    total = 0
+    for shard in shards:
+        start = time.time()
+        new = merge_shard(db, schema, shard)
+        total += new
+        print(f"{shard}: {new} new matches in {time.time() - start:.1f}s")
+    db.close()
+    print(f"Merged {total} matches into {out}")
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("out", help="merged sqlite file, created if missing")
+    parser.add_argument("shards", nargs="+")
+    args = parser.parse_args()
+    merge(args.out, args.shards)
+
+
+if __name__ == "__main__":
+    main()
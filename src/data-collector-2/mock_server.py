@@ -0,0 +1,418 @@
+"""Local stand-in for the parts of the Riot api used by RiotApiInterface.
+
+Serves league-v4, summoner-v4 and match-v5 (ids, match, timeline) under
+`http://host:port/{platform or region}/lol/...`, which is the url layout of
+RiotApiInterface(base_url=...). Payloads are synthetic but shaped and sized
+like the real ones, and the same ids always give the same documents.
+Rate limits are enforced per (api key, routing value) and per method, with
+the real X-*-Rate-Limit headers and 429 answers.
+
+    python mock_server.py --port 8080 --latency 0.05 --app-limit 20:1,100:120
+"""
+
+import argparse
+import functools
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from RiotApiInterface import PLATFORM_TO_REGION, ERROR_CODES
+from rate_limiter import parse_rate_limit_header
+
+
+ROUTES = [
+    ("get_challenger_leagues", re.compile(r"^/(\w+)/lol/league/v4/challengerleagues/by-queue/(\w+)$")),
+    ("get_grandmaster_leagues", re.compile(r"^/(\w+)/lol/league/v4/grandmasterleagues/by-queue/(\w+)$")),
+    ("get_master_leagues", re.compile(r"^/(\w+)/lol/league/v4/masterleagues/by-queue/(\w+)$")),
+    ("get_league_entries", re.compile(r"^/(\w+)/lol/league/v4/entries/(\w+/\w+/\w+)$")),
+    ("get_summoner_by_encrypted_summoner_id", re.compile(r"^/(\w+)/lol/summoner/v4/summoners/([\w-]+)$")),
+    ("get_matchhistory_by_puuid", re.compile(r"^/(\w+)/lol/match/v5/matches/by-puuid/([\w-]+)/ids$")),
+    ("get_match_timeline_by_id", re.compile(r"^/(\w+)/lol/match/v5/matches/(\w+)/timeline$")),
+    ("get_match_by_id", re.compile(r"^/(\w+)/lol/match/v5/matches/(\w+)$")),
+]
+
+TIER_SIZES = {"CHALLENGER": 300, "GRANDMASTER": 700, "MASTER": 3000}
+# players per division of the tiers below master, served in pages
+DIVISION_SIZE = 1000
+ENTRIES_PAGE = 205
+
+# counts of the keys under the participant objects of a real match-v5 document
+PARTICIPANT_FIELDS = 120
+CHALLENGE_FIELDS = 125
+TIMELINE_FRAMES = 30
+
+
+def _rng(*parts):
+    seed = hashlib.sha1("|".join(str(p) for p in parts).encode()).digest()
+    return random.Random(int.from_bytes(seed[:8], "big"))
+
+
+def _key_tag(api_key):
+    # summoner ids are encrypted per api key, so the same player has a different id per key
+    return hashlib.sha1(api_key.encode()).hexdigest()[:8]
+
+
+class FakeRiotData:
+    """Deterministic synthetic players and matches."""
+
+    def __init__(self, players=None, matches_per_region=20000, history_size=20, seed=0):
+        # players per tier and queue on each platform, None keeps the real tier sizes
+        self.players = players
+        self.matches_per_region = matches_per_region
+        self.history_size = history_size
+        self.seed = seed
+
+    def league(self, platform, tier, queue, api_key):
+        n = self.players if self.players is not None else TIER_SIZES[tier]
+        tag = _key_tag(api_key)
+        entries = []
+        for i in range(n):
+            rng = _rng(self.seed, platform, tier, queue, i)
+            wins = rng.randint(50, 600)
+            entries.append(
+                {
+                    "summonerId": f"{tag}-{platform}-{tier[0]}{queue[7]}{i}",
+                    "leaguePoints": rng.randint(0, 2000),
+                    "rank": "I",
+                    "wins": wins,
+                    "losses": rng.randint(50, wins + 50),
+                    "veteran": rng.random() < 0.3,
+                    "inactive": False,
+                    "freshBlood": rng.random() < 0.1,
+                    "hotStreak": rng.random() < 0.2,
+                }
+            )
+        return {
+            "tier": tier,
+            "leagueId": f"{platform}-{tier}-{queue}",
+            "queue": queue,
+            "name": f"Synthetic {tier.title()}",
+            "entries": entries,
+        }
+
+    def league_entries(self, platform, queue, tier, division, page, api_key):
+        n = self.players if self.players is not None else DIVISION_SIZE
+        tag = _key_tag(api_key)
+        entries = []
+        for i in range((page - 1) * ENTRIES_PAGE, min(page * ENTRIES_PAGE, n)):
+            rng = _rng(self.seed, platform, tier, division, queue, i)
+            wins = rng.randint(20, 300)
+            entries.append(
+                {
+                    "leagueId": f"{platform}-{tier}-{division}-{queue}",
+                    "summonerId": f"{tag}-{platform}-{tier[0]}{division}{queue[7]}{i}",
+                    "queueType": queue,
+                    "tier": tier,
+                    "rank": division,
+                    "leaguePoints": rng.randint(0, 100),
+                    "wins": wins,
+                    "losses": rng.randint(20, wins + 20),
+                    "veteran": False,
+                    "inactive": False,
+                    "freshBlood": rng.random() < 0.1,
+                    "hotStreak": rng.random() < 0.2,
+                }
+            )
+        return entries
+
+    def summoner(self, platform, summoner_id):
+        # drop the api key tag, the puuid is the same for every key
+        player = summoner_id.split("-", 1)[1]
+        rng = _rng(self.seed, "summoner", player)
+        return {
+            "id": summoner_id,
+            "accountId": f"acc-{player}",
+            "puuid": f"puuid-{player}",
+            "profileIconId": rng.randint(1, 6000),
+            "revisionDate": 1720000000000 + rng.randint(0, 10**9),
+            "summonerLevel": rng.randint(30, 1500),
+        }
+
+    def match_ids(self, region, puuid, start, count):
+        rng = _rng(self.seed, "history", puuid)
+        # a history lists every match once
+        ids = [
+            self.match_id(region, n)
+            for n in rng.sample(range(self.matches_per_region), min(self.history_size, self.matches_per_region))
+        ]
+        return ids[start : start + count]
+
+    def match_id(self, region, n):
+        platform = next(p for p, r in PLATFORM_TO_REGION.items() if r == region)
+        return f"{platform.upper()}_{7000000000 + n}"
+
+    @functools.lru_cache(maxsize=2048)
+    def match(self, match_id):
+        rng = _rng(self.seed, "match", match_id)
+        game_id = int(match_id.split("_")[1])
+        puuids = [f"puuid-{match_id}-{i}" for i in range(10)]
+        participants = []
+        for i, puuid in enumerate(puuids):
+            p = {
+                "participantId": i + 1,
+                "puuid": puuid,
+                "summonerId": f"sid-{match_id}-{i}",
+                "riotIdGameName": f"Player{rng.randint(0, 10**6)}",
+                "championId": rng.randint(1, 950),
+                "teamId": 100 if i < 5 else 200,
+                "win": (i < 5) == (game_id % 2 == 0),
+            }
+            for f in range(PARTICIPANT_FIELDS - len(p)):
+                p[f"stat{f}"] = rng.randint(0, 50000)
+            p["challenges"] = {f"challenge{f}": rng.random() * 100 for f in range(CHALLENGE_FIELDS)}
+            p["missions"] = {f"playerScore{f}": 0 for f in range(12)}
+            p["perks"] = {
+                "statPerks": {"defense": 5001, "flex": 5008, "offense": 5005},
+                "styles": [
+                    {"description": d, "style": 8000 + 100 * k, "selections": [{"perk": rng.randint(8000, 9000), "var1": rng.randint(0, 999), "var2": 0, "var3": 0} for _ in range(3)]}
+                    for k, d in enumerate(["primaryStyle", "subStyle"])
+                ],
+            }
+            participants.append(p)
+        teams = [
+            {
+                "teamId": team_id,
+                "win": participants[0 if team_id == 100 else 5]["win"],
+                "bans": [{"championId": rng.randint(1, 950), "pickTurn": k + 1} for k in range(5)],
+                "objectives": {o: {"first": rng.random() < 0.5, "kills": rng.randint(0, 11)} for o in ["baron", "champion", "dragon", "horde", "inhibitor", "riftHerald", "tower"]},
+            }
+            for team_id in (100, 200)
+        ]
+        doc = {
+            "metadata": {"dataVersion": "2", "matchId": match_id, "participants": puuids},
+            "info": {
+                "endOfGameResult": "GameComplete",
+                "gameCreation": 1720000000000 + game_id % 10**9,
+                "gameDuration": rng.randint(900, 2700),
+                "gameEndTimestamp": 1720000000000 + game_id % 10**9 + 2000000,
+                "gameId": game_id,
+                "gameMode": "CLASSIC",
+                "gameName": f"teambuilder-match-{game_id}",
+                "gameStartTimestamp": 1720000000000 + game_id % 10**9 + 30000,
+                "gameType": "MATCHED_GAME",
+                "gameVersion": "14.13.596.7996",
+                "mapId": 11,
+                "participants": participants,
+                "platformId": match_id.split("_")[0],
+                "queueId": 420,
+                "teams": teams,
+                "tournamentCode": "",
+            },
+        }
+        return json.dumps(doc).encode()
+
+    @functools.lru_cache(maxsize=512)
+    def timeline(self, match_id):
+        rng = _rng(self.seed, "timeline", match_id)
+        frames = []
+        for minute in range(TIMELINE_FRAMES):
+            frames.append(
+                {
+                    "timestamp": minute * 60000,
+                    "participantFrames": {
+                        str(i): {
+                            "participantId": i,
+                            "currentGold": rng.randint(0, 3000),
+                            "totalGold": rng.randint(0, 20000),
+                            "level": rng.randint(1, 18),
+                            "xp": rng.randint(0, 20000),
+                            "minionsKilled": rng.randint(0, 300),
+                            "jungleMinionsKilled": rng.randint(0, 150),
+                            "position": {"x": rng.randint(0, 15000), "y": rng.randint(0, 15000)},
+                            "championStats": {f"stat{f}": rng.randint(0, 5000) for f in range(25)},
+                            "damageStats": {f"stat{f}": rng.randint(0, 50000) for f in range(12)},
+                        }
+                        for i in range(1, 11)
+                    },
+                    "events": [
+                        {
+                            "type": rng.choice(["ITEM_PURCHASED", "SKILL_LEVEL_UP", "WARD_PLACED", "CHAMPION_KILL", "ITEM_DESTROYED"]),
+                            "timestamp": minute * 60000 + rng.randint(0, 59999),
+                            "participantId": rng.randint(1, 10),
+                            "itemId": rng.randint(1000, 8000),
+                        }
+                        for _ in range(rng.randint(5, 40))
+                    ],
+                }
+            )
+        doc = {
+            "metadata": {"dataVersion": "2", "matchId": match_id, "participants": [f"puuid-{match_id}-{i}" for i in range(10)]},
+            "info": {"frameInterval": 60000, "frames": frames, "gameId": int(match_id.split("_")[1])},
+        }
+        return json.dumps(doc).encode()
+
+
+class EmulatedLimits:
+    """Fixed windows per (api key, routing value) and per (api key, routing value, method), like the real api."""
+
+    def __init__(self, app_limits="20:1,100:120", method_limits="2000:10"):
+        self.app_limits = parse_rate_limit_header(app_limits)
+        self.method_limits = parse_rate_limit_header(method_limits)
+        self._windows = {}
+        self._lock = threading.Lock()
+        # (api key, routing value, method) -> [served, rejected]
+        self.stats = {}
+
+    def _counts(self, key, limits, now):
+        windows = self._windows.setdefault(key, {duration: [0, now] for _, duration in limits})
+        for duration, window in windows.items():
+            if now >= window[1] + duration:
+                window[0] = 0
+                window[1] = now
+        return windows
+
+    def _header(self, limits):
+        return ",".join(f"{limit}:{duration}" for limit, duration in limits)
+
+    def _count_header(self, windows):
+        return ",".join(f"{w[0]}:{duration}" for duration, w in windows.items())
+
+    def check(self, api_key, route, method):
+        """Count the call. Returns (status, headers) with 429 if a window is full."""
+        with self._lock:
+            now = time.time()
+            app = self._counts(("app", api_key, route), self.app_limits, now)
+            meth = self._counts(("method", api_key, route, method), self.method_limits, now)
+            stats = self.stats.setdefault((api_key, route, method), [0, 0])
+            limited, retry_after = None, 0
+            for kind, limits, windows in (("application", self.app_limits, app), ("method", self.method_limits, meth)):
+                for limit, duration in limits:
+                    count, start = windows[duration]
+                    if count >= limit:
+                        limited = limited or kind
+                        retry_after = max(retry_after, start + duration - now)
+            if limited is None:
+                for windows in (app, meth):
+                    for window in windows.values():
+                        window[0] += 1
+                stats[0] += 1
+            else:
+                stats[1] += 1
+            headers = {
+                "X-App-Rate-Limit": self._header(self.app_limits),
+                "X-App-Rate-Limit-Count": self._count_header(app),
+                "X-Method-Rate-Limit": self._header(self.method_limits),
+                "X-Method-Rate-Limit-Count": self._count_header(meth),
+            }
+            if limited is not None:
+                headers["Retry-After"] = str(max(1, int(retry_after + 0.999)))
+                headers["X-Rate-Limit-Type"] = limited
+                return 429, headers
+            return 200, headers
+
+
+class MockRiotServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, data=None, limits=None, latency=0.0, jitter=0.0):
+        super().__init__(address, MockRiotHandler)
+        self.data = data or FakeRiotData()
+        self.limits = limits or EmulatedLimits()
+        self.latency = latency
+        self.jitter = jitter
+
+    @property
+    def base_url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+
+class MockRiotHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, headers=None):
+        if status != 200 and body is None:
+            body = json.dumps({"status": {"message": ERROR_CODES.get(status, ""), "status_code": status}}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json;charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def do_HEAD(self):
+        self._send(404, None)
+
+    def do_GET(self):
+        server = self.server
+        parts = urlsplit(self.path)
+        api_key = self.headers.get("X-Riot-Token")
+        if not api_key:
+            return self._send(401, None)
+        for method, pattern in ROUTES:
+            match = pattern.match(parts.path)
+            if match:
+                break
+        else:
+            return self._send(404, None)
+
+        route, arg = match.group(1), match.group(2)
+        status, headers = server.limits.check(api_key, route, method)
+        if server.latency or server.jitter:
+            time.sleep(server.latency + random.random() * server.jitter)
+        if status != 200:
+            return self._send(status, None, headers)
+
+        data = server.data
+        if method.endswith("_leagues"):
+            tier = method[len("get_"):-len("_leagues")].upper()
+            body = json.dumps(data.league(route, tier, arg, api_key)).encode()
+        elif method == "get_league_entries":
+            queue, tier, division = arg.split("/")
+            page = int(parse_qs(parts.query).get("page", ["1"])[0])
+            body = json.dumps(data.league_entries(route, queue, tier, division, page, api_key)).encode()
+        elif method == "get_summoner_by_encrypted_summoner_id":
+            body = json.dumps(data.summoner(route, arg)).encode()
+        elif method == "get_matchhistory_by_puuid":
+            query = parse_qs(parts.query)
+            start = int(query.get("start", ["0"])[0])
+            count = int(query.get("count", ["20"])[0])
+            body = json.dumps(data.match_ids(route, arg, start, count)).encode()
+        elif method == "get_match_timeline_by_id":
+            body = data.timeline(arg)
+        else:
+            body = data.match(arg)
+        self._send(200, body, headers)
+
+
+def start_mock_server(host="127.0.0.1", port=0, **kwargs):
+    """Start a MockRiotServer on a background thread. Port 0 picks a free port."""
+    server = MockRiotServer((host, port), **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds added to every answer")
+    parser.add_argument("--jitter", type=float, default=0.02, help="random extra latency, seconds")
+    parser.add_argument("--app-limit", default="20:1,100:120")
+    parser.add_argument("--method-limit", default="2000:10")
+    parser.add_argument("--players", type=int, default=None, help="players per tier and queue, default is the real tier size")
+    parser.add_argument("--matches", type=int, default=20000, help="distinct matches per region")
+    args = parser.parse_args()
+
+    server = MockRiotServer(
+        (args.host, args.port),
+        data=FakeRiotData(players=args.players, matches_per_region=args.matches),
+        limits=EmulatedLimits(args.app_limit, args.method_limit),
+        latency=args.latency,
+        jitter=args.jitter,
+    )
+    print(f"Mock riot api on {server.base_url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
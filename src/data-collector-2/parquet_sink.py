@@ -0,0 +1,229 @@
+import os
+import time
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from RiotApiInterface import PLATFORM_TO_REGION
+from schema_registry import sql_type
+
+
+ARROW_TYPES = {
+    "BOOLEAN": pa.bool_(),
+    "INTEGER": pa.int64(),
+    "REAL": pa.float64(),
+    "TEXT": pa.string(),
+}
+
+# numeric types in widening order, anything else widens to string
+NUMERIC_RANK = {pa.bool_(): 0, pa.int64(): 1, pa.float64(): 2}
+
+
+def widen(a, b):
+    """Narrowest type both `a` and `b` values fit in."""
+    if a in NUMERIC_RANK and b in NUMERIC_RANK:
+        return max(a, b, key=NUMERIC_RANK.get)
+    return pa.string()
+
+
+def column_array(values, column_type):
+    """(array, type) of the values, the type is widened if some value does not fit `column_type`."""
+    try:
+        array = pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+        # mixed kinds, e.g. numbers and strings
+        array = None
+    if array is not None and array.type in (column_type, pa.null()):
+        return array.cast(column_type), column_type
+    if array is not None and array.type in NUMERIC_RANK:
+        column_type = widen(column_type, array.type)
+        if column_type != pa.string():
+            return array.cast(column_type), column_type
+    return pa.array([v if v is None or isinstance(v, str) else str(v) for v in values], pa.string()), pa.string()
+
+
+def patch_of(game_version):
+    # "14.13.601.1234" -> "14.13"
+    if not game_version:
+        return "unknown"
+    return ".".join(str(game_version).split(".")[:2])
+
+
+class ParquetSink:
+    """Write matches to parquet datasets, a drop-in for BatchedSqliteWriter.
+
+    Each table is a directory partitioned hive style by region, platform
+    and patch, e.g. game_participants/region=europe/platform=EUW1/patch=14.13.
+    Rows are buffered per partition and appended to the open file of the
+    partition as one row group once `row_group_rows` are collected. Files
+    are written under a .tmp name and renamed when the batch is committed,
+    so readers only see complete files and the matches commit() reports
+    are on disk. Columns are typed like the sqlite tables, from `types` or
+    their first value; a column that is only null so far is left out, and
+    a new column set starts a new file. A value that does not fit its
+    column widens it (int to float, anything else to string) for this and
+    every later file instead of failing the batch.
+    """
+
+    def __init__(self, root, batch_size=5000, batch_ms=60000, row_group_rows=64 * 1024, compression="zstd", report_every=10, types=None):
+        self.root = root
+        self.batch_size = batch_size
+        self.batch_ms = batch_ms
+        self.row_group_rows = row_group_rows
+        self.compression = compression
+        self.report_every = report_every
+        # table -> {column: arrow type}, declared ones first
+        self._types = {
+            table: {column: ARROW_TYPES[t] for column, t in columns.items()}
+            for table, columns in (types or {}).items()
+        }
+        # (table, partition) -> {columns: [rows]}
+        self._buffers = {}
+        self._buffered = {}
+        # (table, partition) -> (ParquetWriter, schema, tmp path, path)
+        self._files = {}
+        # closed files of the batch, renamed on commit
+        self._finished = []
+        self._batch = 0
+        self._batch_start = None
+        self._seq = 0
+        # error of a flush in add_match, the batch is dropped by commit()
+        self._error = None
+        self._rows = 0
+        self._report_start = time.time()
+
+    def add_match(self, tables):
+        """Buffer the rows of one match, given as {table: [(columns, rows)]}."""
+        if self._batch_start is None:
+            self._batch_start = time.time()
+        columns, rows = tables["game_data"][0]
+        platform = rows[0][columns.index("info.platformId")]
+        partition = (
+            PLATFORM_TO_REGION.get(platform.lower(), "unknown"),
+            platform,
+            patch_of(rows[0][columns.index("info.gameVersion")]),
+        )
+        full = []
+        for table, chunks in tables.items():
+            key = (table, partition)
+            buffer = self._buffers.setdefault(key, {})
+            for columns, rows in chunks:
+                buffer.setdefault(columns, []).extend(rows)
+                self._buffered[key] = self._buffered.get(key, 0) + len(rows)
+            if self._buffered[key] >= self.row_group_rows:
+                full.append(key)
+        # counted first, the index commit() reports must match the calls to add_match
+        self._batch += 1
+        for key in full:
+            try:
+                self._flush(key)
+            except Exception as e:
+                self._error = e
+
+    def pending(self):
+        return self._batch
+
+    def time_left(self):
+        """Seconds until the current batch is due, None if it is empty."""
+        if self._batch_start is None:
+            return None
+        return max(0.0, self._batch_start + self.batch_ms / 1000 - time.time())
+
+    def due(self):
+        return self._batch >= self.batch_size or (
+            self._batch_start is not None and self.time_left() == 0
+        )
+
+    def _arrow_table(self, table, columns, rows):
+        types = self._types.setdefault(table, {})
+        kept = []
+        for i, column in enumerate(columns):
+            if column not in types:
+                column_type = next((sql_type(row[i]) for row in rows if row[i] is not None), None)
+                if column_type is None:
+                    continue
+                types[column] = ARROW_TYPES[column_type]
+            kept.append(i)
+        arrays = []
+        for i in kept:
+            array, types[columns[i]] = column_array([row[i] for row in rows], types[columns[i]])
+            arrays.append(array)
+        schema = pa.schema([(columns[i], types[columns[i]]) for i in kept])
+        return pa.Table.from_arrays(arrays, schema=schema)
+
+    def _open(self, key, schema):
+        table, (region, platform, patch) = key
+        directory = os.path.join(self.root, table, f"region={region}", f"platform={platform}", f"patch={patch}")
+        os.makedirs(directory, exist_ok=True)
+        self._seq += 1
+        path = os.path.join(directory, f"part-{int(time.time() * 1000)}-{os.getpid()}-{self._seq}.parquet")
+        writer = pq.ParquetWriter(path + ".tmp", schema, compression=self.compression)
+        self._files[key] = (writer, schema, path + ".tmp", path)
+        return writer
+
+    def _close(self, key):
+        writer, _, tmp, path = self._files.pop(key)
+        writer.close()
+        self._finished.append((tmp, path))
+
+    def _flush(self, key):
+        for columns, rows in self._buffers.pop(key, {}).items():
+            data = self._arrow_table(key[0], columns, rows)
+            if data.num_columns == 0:
+                continue
+            file = self._files.get(key)
+            if file is not None and not file[1].equals(data.schema):
+                self._close(key)
+                file = None
+            writer = file[0] if file is not None else self._open(key, data.schema)
+            writer.write_table(data, row_group_size=self.row_group_rows)
+            self._rows += data.num_rows
+        self._buffered.pop(key, None)
+
+    def _discard(self):
+        for writer, _, tmp, _ in self._files.values():
+            writer.close()
+            self._finished.append((tmp, None))
+        for tmp, _ in self._finished:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        self._files = {}
+        self._finished = []
+        self._buffers = {}
+        self._buffered = {}
+
+    def commit(self):
+        """Write the buffered matches and rotate the open files. Returns the indexes of the matches written."""
+        matches = self._batch
+        self._batch = 0
+        self._batch_start = None
+        if not matches:
+            return []
+        try:
+            if self._error is not None:
+                raise self._error
+            for key in list(self._buffers):
+                self._flush(key)
+            for key in list(self._files):
+                self._close(key)
+            for tmp, path in self._finished:
+                os.replace(tmp, path)
+            self._finished = []
+        except Exception as e:
+            # the batch is lost, its matches are not marked done and fetched again on --resume
+            print(f"Parquet sink | dropping batch of {matches} matches: {e}")
+            self._discard()
+            self._error = None
+            return []
+        self._report()
+        return list(range(matches))
+
+    def _report(self):
+        elapsed = time.time() - self._report_start
+        if elapsed >= self.report_every:
+            print(f"Parquet sink | {self._rows / elapsed:.0f} rows/s")
+            self._rows = 0
+            self._report_start = time.time()
+
+    def close(self):
+        self.commit()
@@ -0,0 +1,27 @@
+class PipelinePolicy:
+    """When the discovery stages of the crawl may dispatch next to the match fetches.
+
+    Summoner lookups, match histories and match fetches run at the same
+    time. Summoner lookups use the platform hosts, whose budget nothing
+    else needs. Match histories and match fetches share the application
+    limit of the region host.
+
+    - Discovery (summoner and match history jobs) pauses while
+      `max_match_queue` match ids wait, so finding matches never runs far
+      ahead of fetching them.
+    - While matches wait, a match history job is only dispatched if more
+      than `match_share` of the region budget of its key is unused. The
+      rest stays for the match fetches.
+    """
+
+    def __init__(self, max_match_queue=5000, match_share=0.5):
+        self.max_match_queue = max_match_queue
+        self.match_share = match_share
+
+    def discover(self, match_queue_size):
+        return match_queue_size < self.max_match_queue
+
+    def history_allowed(self, rate_limiter, api_key, host, match_queue_size):
+        if not self.discover(match_queue_size):
+            return False
+        return match_queue_size == 0 or rate_limiter.headroom(api_key, host) > self.match_share
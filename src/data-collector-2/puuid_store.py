@@ -0,0 +1,52 @@
+import os
+import sqlite3
+import threading
+
+
+class PuuidStore:
+    """Persistent summonerId -> puuid mapping, the mapping of a player never changes.
+
+    Summoner ids are encrypted per api key, so an id already tells which
+    key it was read with and the puuid stored for it is the one that key
+    sees. The whole mapping is kept in memory, puts are written through.
+    """
+
+    def __init__(self, path="data/puuids.db"):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS summoners (summoner_id TEXT PRIMARY KEY, platform TEXT, puuid TEXT)"
+        )
+        self._db.commit()
+        self._lock = threading.Lock()
+        self._puuids = dict(self._db.execute("SELECT summoner_id, puuid FROM summoners"))
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, summoner_id):
+        """puuid of the summoner, None if it was never looked up."""
+        puuid = self._puuids.get(summoner_id)
+        if puuid is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return puuid
+
+    def put(self, summoner_id, platform, puuid):
+        with self._lock:
+            if self._puuids.get(summoner_id) == puuid:
+                return
+            self._puuids[summoner_id] = puuid
+            self._db.execute("INSERT OR REPLACE INTO summoners VALUES (?, ?, ?)", (summoner_id, platform, puuid))
+            self._db.commit()
+
+    def __len__(self):
+        return len(self._puuids)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,174 @@
+import threading
+import time
+
+
+# Limits of a development key. Used until the first response tells us the real ones.
+DEFAULT_APP_LIMITS = "20:1,100:120"
+
+
+def parse_rate_limit_header(value):
+    """Parse a Riot rate limit header like "20:1,100:120" into [(20, 1), (100, 120)].
+
+    The same format is used by the -Count headers, where the first number is the
+    number of calls already made in the window.
+    """
+    windows = []
+    if not value:
+        return windows
+    for part in value.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        amount, seconds = part.split(":")
+        windows.append((int(amount), int(seconds)))
+    return windows
+
+
+class RateWindow:
+    """Fixed window: `limit` calls allowed in `duration` seconds, starting at the first call."""
+
+    __slots__ = ("limit", "duration", "count", "start")
+
+    def __init__(self, limit, duration, count=0, start=None):
+        self.limit = limit
+        self.duration = duration
+        self.count = count
+        self.start = start
+
+    def _roll(self, now):
+        if self.start is not None and now >= self.start + self.duration:
+            self.count = 0
+            self.start = None
+
+    def wait_time(self, now):
+        self._roll(now)
+        if self.count < self.limit:
+            return 0.0
+        return self.start + self.duration - now
+
+    def hit(self, now):
+        if self.start is None:
+            self.start = now
+        self.count += 1
+
+
+class RateLimiter:
+    """Rate limiter shared by all threads of a process.
+
+    Riot enforces an application limit per (api key, routing host) and a method
+    limit per (api key, routing host, method), each made of several windows
+    (e.g. 20 calls / 1s and 100 calls / 120s). Limits and counts are learned from
+    the X-App-Rate-Limit, X-Method-Rate-Limit and matching -Count headers, so the
+    same code runs at full speed with development and production keys.
+    """
+
+    def __init__(self, default_app_limits=DEFAULT_APP_LIMITS, default_method_limits=None):
+        self.default_app_limits = parse_rate_limit_header(default_app_limits)
+        self.default_method_limits = parse_rate_limit_header(default_method_limits)
+        self._buckets = {}
+        self._paused_until = {}
+        self._lock = threading.Lock()
+
+    def _bucket_keys(self, api_key, host, method):
+        return [("app", api_key, host), ("method", api_key, host, method)]
+
+    def _get_bucket(self, bucket_key):
+        bucket = self._buckets.get(bucket_key)
+        if bucket is None:
+            defaults = (
+                self.default_app_limits
+                if bucket_key[0] == "app"
+                else self.default_method_limits
+            )
+            bucket = [RateWindow(limit, duration) for limit, duration in defaults]
+            self._buckets[bucket_key] = bucket
+        return bucket
+
+    def _wait_time(self, api_key, buckets, now):
+        paused = self._paused_until.get(api_key, 0.0) - now
+        return max([w.wait_time(now) for b in buckets for w in b] + [paused, 0.0])
+
+    def wait_time(self, api_key, host, method):
+        """Seconds until a call would be allowed, without consuming anything."""
+        with self._lock:
+            buckets = [self._get_bucket(k) for k in self._bucket_keys(api_key, host, method)]
+            return self._wait_time(api_key, buckets, time.time())
+
+    def headroom(self, api_key, host):
+        """Unused share of the tightest application window of (api_key, host), 1.0 before the first call."""
+        with self._lock:
+            now = time.time()
+            shares = [1.0]
+            for window in self._get_bucket(("app", api_key, host)):
+                window._roll(now)
+                shares.append(max(0.0, window.limit - window.count) / window.limit)
+            return min(shares)
+
+    def pause(self, api_key, seconds):
+        """Hold every call of `api_key` for `seconds`, e.g. after an application level 429."""
+        with self._lock:
+            until = time.time() + seconds
+            if until > self._paused_until.get(api_key, 0.0):
+                self._paused_until[api_key] = until
+
+    def reserve(self, api_key, host, method):
+        """Consume a call if every window allows it and return 0, otherwise return the seconds to wait."""
+        with self._lock:
+            now = time.time()
+            buckets = [self._get_bucket(k) for k in self._bucket_keys(api_key, host, method)]
+            wait = self._wait_time(api_key, buckets, now)
+            if wait > 0:
+                return wait
+            for bucket in buckets:
+                for window in bucket:
+                    window.hit(now)
+            return 0.0
+
+    def acquire(self, api_key, host, method):
+        """Block until a call is allowed and consume it."""
+        while True:
+            wait = self.reserve(api_key, host, method)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    def update(self, api_key, host, method, headers):
+        """Synchronize limits and counts with the headers of a response."""
+        app_key, method_key = self._bucket_keys(api_key, host, method)
+        with self._lock:
+            now = time.time()
+            self._update_bucket(
+                app_key,
+                headers.get("X-App-Rate-Limit"),
+                headers.get("X-App-Rate-Limit-Count"),
+                now,
+            )
+            self._update_bucket(
+                method_key,
+                headers.get("X-Method-Rate-Limit"),
+                headers.get("X-Method-Rate-Limit-Count"),
+                now,
+            )
+
+    def _update_bucket(self, bucket_key, limit_header, count_header, now):
+        limits = parse_rate_limit_header(limit_header)
+        if not limits:
+            return
+        old = {w.duration: w for w in self._get_bucket(bucket_key)}
+        bucket = []
+        for limit, duration in limits:
+            window = old.get(duration)
+            if window is None:
+                window = RateWindow(limit, duration)
+            window.limit = limit
+            bucket.append(window)
+        # counts reported by the server also include calls of other processes using the same key
+        counts = dict((duration, count) for count, duration in parse_rate_limit_header(count_header))
+        for window in bucket:
+            window._roll(now)
+            count = counts.get(window.duration, 0)
+            if count > window.count:
+                window.count = count
+                if window.start is None:
+                    window.start = now
+        self._buckets[bucket_key] = bucket
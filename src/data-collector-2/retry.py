@@ -0,0 +1,103 @@
+import heapq
+import itertools
+import random
+import threading
+import time
+
+import requests
+
+from RiotApiInterface import RiotApiError
+
+
+# 429 is retried after Retry-After, the others with exponential backoff
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class RetryPolicy:
+    """Decide if and when a failed call is tried again.
+
+    A 429 waits for its Retry-After header. Server errors, a 429 without the
+    header and connection errors back off exponentially with full jitter,
+    starting at `base_delay` and capped at `max_delay` seconds.
+    """
+
+    def __init__(self, max_retries=5, base_delay=1.0, max_delay=60.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def backoff(self, attempt):
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def delay(self, error, attempt):
+        """Seconds to wait before the next attempt, None if the call should be dropped."""
+        if attempt >= self.max_retries:
+            return None
+        if isinstance(error, RiotApiError):
+            if error.status_code not in RETRY_STATUS_CODES:
+                return None
+            if error.status_code == 429 and error.retry_after is not None:
+                return error.retry_after
+            return self.backoff(attempt)
+        if isinstance(error, requests.RequestException):
+            return self.backoff(attempt)
+        return None
+
+
+def is_app_rate_limited(error):
+    """True for a 429 counted against the whole application limit of the key."""
+    return (
+        isinstance(error, RiotApiError)
+        and error.status_code == 429
+        and error.rate_limit_type == "application"
+    )
+
+
+class RetryQueue:
+    """Failed jobs per (api key, endpoint), ordered by the time they may run again.
+
+    The dispatcher takes ready retries before new work, so a failed job
+    re-enters the scheduler ahead of everything queued after it.
+    """
+
+    def __init__(self, policy=None):
+        self.policy = policy or RetryPolicy()
+        self._heaps = {}
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def push(self, key, job, error, attempt):
+        """Schedule `job` again after `error`. Returns False if the policy gives up on it."""
+        delay = self.policy.delay(error, attempt)
+        if delay is None:
+            return False
+        with self._lock:
+            heap = self._heaps.setdefault(key, [])
+            heapq.heappush(heap, (time.time() + delay, next(self._counter), attempt + 1, job))
+        return True
+
+    def peek_ready(self, key):
+        """(job, attempt) of the first retry of `key` that is due, without removing it."""
+        with self._lock:
+            heap = self._heaps.get(key)
+            if heap and heap[0][0] <= time.time():
+                return heap[0][3], heap[0][2]
+        return None
+
+    def next_ready(self, key):
+        """Time the first retry of `key` is due, None if it has none."""
+        with self._lock:
+            heap = self._heaps.get(key)
+            return heap[0][0] if heap else None
+
+    def pop_ready(self, key):
+        with self._lock:
+            heap = self._heaps.get(key)
+            if heap and heap[0][0] <= time.time():
+                _, _, attempt, job = heapq.heappop(heap)
+                return job, attempt
+        return None
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(heap) for heap in self._heaps.values())
@@ -0,0 +1,58 @@
+import heapq
+import itertools
+import threading
+import time
+
+
+class Scheduler:
+    """Min-heap of the next time each (api key, endpoint) may dispatch a job.
+
+    The dispatcher sleeps until the earliest key is due instead of scanning
+    every key on a fixed tick. Keys without work are parked and go back on
+    the heap when `notify` reports new work or a finished job.
+    """
+
+    def __init__(self, keys):
+        self._counter = itertools.count()
+        self._heap = [(0.0, next(self._counter), key) for key in keys]
+        heapq.heapify(self._heap)
+        self._parked = set()
+        # bumped by every notify, a key popped before the bump is not parked
+        self._version = 0
+        self._cond = threading.Condition()
+
+    def next_due(self, timeout):
+        """Block until a key is due and pop it as (key, version), or return None after `timeout` seconds."""
+        with self._cond:
+            deadline = time.time() + timeout
+            while True:
+                now = time.time()
+                if self._heap and self._heap[0][0] <= now:
+                    return heapq.heappop(self._heap)[2], self._version
+                if now >= deadline:
+                    return None
+                wake = self._heap[0][0] if self._heap else deadline
+                self._cond.wait(min(wake, deadline) - now)
+
+    def reschedule(self, key, at):
+        with self._cond:
+            heapq.heappush(self._heap, (at, next(self._counter), key))
+            self._cond.notify()
+
+    def park(self, key, version):
+        """Keep `key` off the heap until the next notify."""
+        with self._cond:
+            if version != self._version:
+                heapq.heappush(self._heap, (time.time(), next(self._counter), key))
+            else:
+                self._parked.add(key)
+
+    def notify(self):
+        """New work or free capacity: every parked key is due now."""
+        with self._cond:
+            self._version += 1
+            now = time.time()
+            for key in self._parked:
+                heapq.heappush(self._heap, (now, next(self._counter), key))
+            self._parked.clear()
+            self._cond.notify()
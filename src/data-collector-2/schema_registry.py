@@ -0,0 +1,110 @@
+def sql_type(value):
+    """Declared type of a column first seen with `value`, None for null."""
+    if value is None:
+        return None
+    # bool before int, True is an int as well
+    if isinstance(value, bool):
+        return "BOOLEAN"
+    if isinstance(value, int):
+        return "INTEGER"
+    if isinstance(value, float):
+        return "REAL"
+    return "TEXT"
+
+
+class SchemaRegistry:
+    """Typed columns of the tables of one sqlite database.
+
+    The declared types are read back from the database, so the tables are
+    the only record of the schema. Columns get the type given in `types`
+    ({table: {column: type}}) or the type of their first non null value;
+    a column that only held nulls so far is left out of the insert until
+    a value gives it a type. New columns are added with ALTER TABLE and
+    bump the version of the table, insert statements are cached per
+    version and column set.
+    """
+
+    def __init__(self, db, types=None):
+        self.db = db
+        self.types = types or {}
+        self._tables = {}
+        self._versions = {}
+        self._statements = {}
+        self.reload()
+
+    def reload(self):
+        """Read the schema from the database again, e.g. after a rollback dropped new columns."""
+        self._tables = {}
+        for (table,) in self.db.execute("SELECT name FROM sqlite_master WHERE type = 'table'"):
+            self._tables[table] = {row[1]: row[2] for row in self.db.execute(f'PRAGMA table_info("{table}")')}
+        for table in self._tables:
+            self._versions[table] = self._versions.get(table, 0) + 1
+        self._statements = {}
+
+    def columns(self, table):
+        """{column: declared type} of `table`, empty if it does not exist yet."""
+        return self._tables.get(table, {})
+
+    def version(self, table):
+        return self._versions.get(table, 0)
+
+    def _new_types(self, table, columns, rows, missing):
+        declared = self.types.get(table, {})
+        types = {}
+        for column in missing:
+            column_type = declared.get(column)
+            if column_type is None:
+                i = columns.index(column)
+                column_type = next((sql_type(row[i]) for row in rows if row[i] is not None), None)
+            if column_type is not None:
+                types[column] = column_type
+        return types
+
+    def _evolve(self, table, types):
+        known = self._tables.get(table)
+        if known is None:
+            definition = ", ".join(f'"{c}" {t}' for c, t in types.items())
+            self.db.execute(f'CREATE TABLE IF NOT EXISTS "{table}" ({definition})')
+            self._tables[table] = dict(types)
+        else:
+            for column, column_type in types.items():
+                self.db.execute(f'ALTER TABLE "{table}" ADD COLUMN "{column}" {column_type}')
+                known[column] = column_type
+        self._versions[table] = self._versions.get(table, 0) + 1
+
+    def ensure(self, table, types):
+        """Create `table` or add the columns of `types` ({column: type}) it is missing."""
+        known = self.columns(table)
+        missing = {c: t for c, t in types.items() if c not in known}
+        if missing:
+            self._evolve(table, missing)
+
+    def prepare(self, table, columns, rows):
+        """Insert statement for `rows` of `table` and the positions of the values it takes.
+
+        Positions is None when every column is inserted, the usual case.
+        The statement is None when none of the columns has a type yet.
+        """
+        key = (table, self.version(table), columns)
+        prepared = self._statements.get(key)
+        if prepared is not None:
+            return prepared
+        known = self.columns(table)
+        missing = [c for c in columns if c not in known]
+        if missing:
+            types = self._new_types(table, columns, rows, missing)
+            if types:
+                self._evolve(table, types)
+                known = self.columns(table)
+        kept = [i for i, c in enumerate(columns) if c in known]
+        if not kept:
+            # nothing typed yet, nothing to insert
+            return None, kept
+        names = ", ".join(f'"{columns[i]}"' for i in kept)
+        marks = ", ".join("?" for _ in kept)
+        statement = f'INSERT INTO "{table}" ({names}) VALUES ({marks})'
+        if len(kept) < len(columns):
+            # untyped null columns, checked again with the next rows
+            return statement, kept
+        prepared = self._statements[(table, self.version(table), columns)] = (statement, None)
+        return prepared
@@ -0,0 +1,27 @@
+import itertools
+
+
+# seed players: apex leagues are one call per (platform, queue), the
+# (tier, division) pairs below master are read page by page, e.g. ("DIAMOND", "I")
+SEED_QUEUES = ["RANKED_SOLO_5x5", "RANKED_FLEX_SR"]
+SEED_TIERS = ["CHALLENGER", "GRANDMASTER", "MASTER"]
+ENTRY_TIERS = []
+
+
+class SeedOwners:
+    """Api key that reads the next league page of a platform.
+
+    summonerIds are encrypted per key, so a page is read by one key and its
+    players are looked up with that key. The keys take turns per page,
+    starting at a different key for every platform, so every key gets
+    players of every platform. A player in pages of two keys is looked up
+    by both, there is no way to tell the ids apart.
+    """
+
+    def __init__(self, api_keys, platforms):
+        self.api_keys = api_keys
+        self._turns = {platform: itertools.count(i) for i, platform in enumerate(platforms)}
+
+    def next(self, platform):
+        # itertools.count is atomic under the GIL, seeding threads share it
+        return self.api_keys[next(self._turns[platform]) % len(self.api_keys)]
@@ -0,0 +1,77 @@
+import heapq
+import itertools
+import threading
+
+
+class SnowballFrontier:
+    """Participants of fetched matches, waiting for their match history.
+
+    Every fetched match lists its 10 puuids in metadata.participants, so
+    new players come for free instead of from another summoner-v4 lookup.
+    The apex seeds are depth 0, the players of their matches depth 1 and
+    so on up to `max_depth`. match-v5 carries no rank, so the depth stands
+    in for the tier: lower depths go first, then the most recent games.
+
+    puuids are encrypted per api key, so each key has its own frontier and
+    seen set and a puuid is only asked with the key that found it.
+    `max_players` bounds the players taken per key, None for no bound.
+    """
+
+    def __init__(self, max_depth=2, max_players=None):
+        self.max_depth = max_depth
+        self.max_players = max_players
+        # api key -> heap of (depth, -game start, seq, puuid)
+        self._heaps = {}
+        # api key -> puuids seen with that key
+        self._seen = {}
+        # match id -> depth of the snowball player it came from, seeds are absent
+        self._match_depth = {}
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def seen(self, api_key, puuid):
+        """Mark a seed, its history is fetched by the seed stage."""
+        with self._lock:
+            self._seen.setdefault(api_key, set()).add(puuid)
+
+    def add_match_ids(self, match_ids, depth):
+        """Match ids found in the history of a player at `depth`."""
+        if depth == 0:
+            return
+        with self._lock:
+            for match_id in match_ids:
+                self._match_depth[match_id] = depth
+
+    def add_match(self, api_key, match):
+        """Queue the unseen participants of a match fetched with `api_key`."""
+        with self._lock:
+            depth = self._match_depth.pop(match["metadata"]["matchId"], 0) + 1
+            if depth > self.max_depth:
+                return
+            seen = self._seen.setdefault(api_key, set())
+            heap = self._heaps.setdefault(api_key, [])
+            game_start = match["info"].get("gameStartTimestamp") or 0
+            for puuid in match["metadata"]["participants"]:
+                if puuid in seen:
+                    continue
+                if self.max_players is not None and len(seen) >= self.max_players:
+                    return
+                seen.add(puuid)
+                heapq.heappush(heap, (depth, -game_start, next(self._seq), puuid))
+
+    def pop(self, api_key):
+        """(puuid, depth) to fetch next with `api_key`, None if there is none."""
+        with self._lock:
+            heap = self._heaps.get(api_key)
+            if not heap:
+                return None
+            depth, _, _, puuid = heapq.heappop(heap)
+            return puuid, depth
+
+    def pending(self, api_key):
+        with self._lock:
+            return bool(self._heaps.get(api_key))
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(heap) for heap in self._heaps.values())
@@ -0,0 +1,65 @@
+# events kept by default: item buys, sells and undos, kills and level ups
+DEFAULT_EVENT_TYPES = frozenset(
+    {
+        "ITEM_PURCHASED",
+        "ITEM_SOLD",
+        "ITEM_DESTROYED",
+        "ITEM_UNDO",
+        "CHAMPION_KILL",
+        "LEVEL_UP",
+        "SKILL_LEVEL_UP",
+    }
+)
+
+# fixed columns of game_timeline, other fields of the events are not kept
+TIMELINE_COLUMNS = (
+    "gameId",
+    "platformId",
+    "timestamp",
+    "type",
+    "participantId",
+    "itemId",
+    "afterId",
+    "beforeId",
+    "goldGain",
+    "killerId",
+    "victimId",
+    "bounty",
+    "level",
+    "skillSlot",
+    "position.x",
+    "position.y",
+)
+
+# declared up front, most columns are null for most event types
+TIMELINE_TYPES = {column: "INTEGER" for column in TIMELINE_COLUMNS}
+TIMELINE_TYPES["type"] = "TEXT"
+TIMELINE_TYPES["platformId"] = "TEXT"
+
+
+def timeline_rows(game_id, platform_id, events):
+    """(columns, rows) of game_timeline for the events of one match, gameIds repeat across platforms."""
+    rows = []
+    for event in events:
+        position = event.get("position") or {}
+        rows.append(
+            (
+                game_id,
+                platform_id,
+                event.get("timestamp"),
+                event["type"],
+                event.get("participantId"),
+                event.get("itemId"),
+                event.get("afterId"),
+                event.get("beforeId"),
+                event.get("goldGain"),
+                event.get("killerId"),
+                event.get("victimId"),
+                event.get("bounty"),
+                event.get("level"),
+                event.get("skillSlot"),
+                position.get("x"),
+                position.get("y"),
+            )
+        )
+    return TIMELINE_COLUMNS, rows
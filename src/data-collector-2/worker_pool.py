@@ -0,0 +1,76 @@
+import queue
+import threading
+
+
+class WorkerPool:
+    """Fixed worker threads per (api key, endpoint), started once and reused for every job.
+
+    Each worker keeps its own long-lived RiotApiInterface, created by
+    `new_interface`, and passes it as the first argument of the job function.
+    At most `max_in_flight` jobs (queued or running) are accepted per key, so a
+    slow upstream makes `submit` refuse work instead of piling up threads.
+    `on_done` is called after every finished job, once its slot is free again.
+    """
+
+    def __init__(self, new_interface, workers=4, max_in_flight=None, on_done=None):
+        self.new_interface = new_interface
+        self.on_done = on_done
+        self.workers = workers
+        self.max_in_flight = max_in_flight or 2 * workers
+        self._queues = {}
+        self._threads = []
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def _start_workers(self, key):
+        jobs = queue.Queue()
+        self._queues[key] = jobs
+        self._in_flight[key] = 0
+        for _ in range(self.workers):
+            t = threading.Thread(target=self._worker, args=(key, jobs), daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def _worker(self, key, jobs):
+        rai = self.new_interface()
+        while True:
+            job = jobs.get()
+            if job is None:
+                break
+            func, args = job
+            try:
+                func(rai, *args)
+            except Exception as e:
+                print(f"Job {func.__name__} failed: {e}")
+            finally:
+                with self._lock:
+                    self._in_flight[key] -= 1
+                if self.on_done:
+                    self.on_done()
+
+    def has_capacity(self, key):
+        with self._lock:
+            return self._in_flight.get(key, 0) < self.max_in_flight
+
+    def submit(self, key, func, *args):
+        """Queue `func(rai, *args)` on the workers of `key`. Returns False if the key is at its cap."""
+        with self._lock:
+            if key not in self._queues:
+                self._start_workers(key)
+            if self._in_flight[key] >= self.max_in_flight:
+                return False
+            self._in_flight[key] += 1
+            self._queues[key].put((func, args))
+        return True
+
+    def busy(self):
+        with self._lock:
+            return any(n > 0 for n in self._in_flight.values())
+
+    def close(self):
+        with self._lock:
+            for jobs in self._queues.values():
+                for _ in range(self.workers):
+                    jobs.put(None)
+        for t in self._threads:
+            t.join()
@@ -7,4 +7,7 @@ python ./src/data-collector-2/main.py asia &
 python ./src/data-collector-2/main.py sea &
 
 # Wait for all background processes to finish
-wait
\ No newline at end of file
+wait
+
+# Merge the per-region shards into data/data.db
+python ./src/data-collector-2/merge_shards.py data/data.db data/shards/data_*.db
\ No newline at end of file